@@ -12,14 +12,16 @@ import os
 import shutil
 import time
 import tempfile
+import threading
 import traceback
 
-from flask import Flask, make_response, request
+from flask import Flask, g, make_response, request
 from flask_cors import CORS
 
-from ocr import __version__
+from ocr import __version__, metrics
 from ocr.sigma import conf
 from ocr.engine import SigmaOCR
+from ocr.jobs import JobQueue, QueueFullError
 from ocr.sigma.query import Query
 
 HTTP_PORT_SERVICE = 7002
@@ -45,13 +47,89 @@ logger.info("OCR length: {}".format(OCR_LENGTH))
 OCR_OFFSET = conf.get_ocr_offset()
 logger.info("OCR offset: {}".format(OCR_OFFSET))
 
+OCR_ENGINE = conf.get_ocr_engine()
+OCR_WORKERS = conf.get_ocr_workers()
+logger.info("OCR engine: {}, workers: {}".format(OCR_ENGINE, OCR_WORKERS))
+
+OCR_QUORUM = conf.get_ocr_quorum()
+logger.info("OCR quorum: {}".format(OCR_QUORUM))
+
+OCR_CACHE = conf.get_ocr_cache()
+logger.info("OCR cache: {}".format(OCR_CACHE))
+
+OCR_DEBUG = conf.get_ocr_debug()
+logger.info("OCR debug: {}".format(OCR_DEBUG))
+
+OCR_JOBS = conf.get_ocr_jobs()
+logger.info("OCR jobs: {}".format(OCR_JOBS))
+OCR_JOB_MAX_WAIT = 30
+
+OCR_METRICS = conf.get_ocr_metrics()
+logger.info("OCR metrics: {}".format(OCR_METRICS))
+metrics.enable(OCR_METRICS)
+
 app = Flask("autoserv")
 cors = CORS(app)
-query = Query(conf)
-engine = SigmaOCR(PATTERN_STR)
-engine.set_length(OCR_LENGTH)
-engine.set_whitelist_char(OCR_WHITE_LIST)
-engine.set_offset(OCR_OFFSET)
+
+
+@app.before_request
+def start_timer():
+    if metrics.is_enabled():
+        g.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    start = g.get('start_time')
+    if start is not None:
+        metrics.observe(metrics.REQUEST_SECONDS, time.perf_counter() - start, endpoint=request.endpoint or 'unknown',
+                        method=request.method, status=response.status_code)
+    return response
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def create_engine():
+    engine = SigmaOCR(PATTERN_STR)
+    engine.set_length(OCR_LENGTH)
+    engine.set_whitelist_char(OCR_WHITE_LIST)
+    engine.set_offset(OCR_OFFSET)
+    engine.set_engine(OCR_ENGINE, OCR_WORKERS)
+    engine.set_workers(OCR_WORKERS)
+    engine.set_quorum(OCR_QUORUM)
+    engine.set_cache(OCR_CACHE.get('size', 0), OCR_CACHE.get('ttl'))
+    return engine
+
+
+def services():
+    """Get the OCR engine, the query and the OCR job queue of this process, created on first use.
+
+    Under a pre-forking server (see gunicorn.conf.py) every worker creates its own after the fork,
+    so no engine, thread pool or database connection is shared across processes.
+    Only the job states are shared, through the jobs folder.
+    """
+    pid = os.getpid()
+    if _services.get('pid') != pid:
+        with _services_lock:
+            if _services.get('pid') != pid:
+                logger.info("Initialize OCR engine and query in process {}".format(pid))
+                jobs = JobQueue(os.path.join(OCR_IMAGE_STORE_PATH, 'jobs'), OCR_JOBS.get('queue', 64),
+                                OCR_JOBS.get('workers', 2), OCR_JOBS.get('ttl', 3600))
+                _services.update(engine=create_engine(), query=Query(conf), jobs=jobs, pid=pid)
+    return _services
+
+
+def get_engine():
+    return services()['engine']
+
+
+def get_query():
+    return services()['query']
+
+
+def get_jobs():
+    return services()['jobs']
 
 
 @app.route("/autorun/series", methods=["GET"])
@@ -92,7 +170,7 @@ def get_series():
         return make_response(json.dumps(response), 400)
 
     latest = request.args.get('latest', 'True').lower() == 'true'
-    result = query.get_series(latest, **kwargs)
+    result = get_query().get_series(latest, **kwargs)
     if latest:
         result = {} if not result else result[0]
     logger.info("get series process status {}".format(result))
@@ -121,7 +199,7 @@ def get_json():
         response["error"]["message"] = "缺少参数!"
         return make_response(json.dumps(response), 400)
 
-    json_data = query.get_json(series_id)
+    json_data = get_query().get_json(series_id)
 
     logger.info("get json result {}".format(json_data))
     response["message"] = "Get json successfully!"
@@ -141,7 +219,7 @@ def raise_priority(job_id):
         response["error"]["message"] = "缺少参数!"
         return make_response(json.dumps(response), 400)
 
-    priority_data = query.raise_priority(job_id)
+    priority_data = get_query().raise_priority(job_id)
 
     logger.info("raise priority result {}".format(priority_data))
     response["message"] = "Raise priority successfully!"
@@ -150,35 +228,164 @@ def raise_priority(job_id):
     return make_response(json.dumps(response), 200)
 
 
-@app.route("/ocr/", methods=["POST"])
-def ocr():
-    """OCR process."""
-    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": ""}
-    file_storages = request.files.getlist('file')
+def read_ocr_request():
+    """Read the uploaded images, thresholds and patient id of an OCR request."""
     patient_id = request.form.get('patient_id', '')
     threshold = {}
-    image_dir = tempfile.mkdtemp(dir=workspace())
-    logger.info('OCR image_dir: {}'.format(image_dir))
-    for file_storage in file_storages:
+    images = collections.OrderedDict()
+    for file_storage in request.files.getlist('file'):
         file_name = file_storage.filename
-        file_path = os.path.join(image_dir, file_name)
-        file_storage.save(file_path)
+        images[file_name] = file_storage.read()
         thres = request.form.get('threshold+{}'.format(file_name))
         if thres:
             threshold[file_name] = int(thres)
-    if len(file_storages) == 1 and not patient_id and not threshold:
+    return images, threshold, patient_id
+
+
+def run_ocr(images, threshold, patient_id):
+    """Run legacy OCR on a single plain image, setup or apply otherwise. Returns (result, stats)."""
+    stats = {}
+    image_dir = None
+    if OCR_DEBUG:
+        image_dir = tempfile.mkdtemp(dir=workspace())
+        logger.info('OCR image_dir: {}'.format(image_dir))
+        for file_name, buf in images.items():
+            with open(os.path.join(image_dir, file_name), 'wb') as f:
+                f.write(buf)
+    engine = get_engine()
+    if len(images) == 1 and not patient_id and not threshold:
         logger.debug('legacy ocr')
-        image_file = os.path.join(image_dir, file_storages[0].filename)
-        result = engine.ocr_legacy(image_file)
+        result = engine.ocr_legacy(next(iter(images.values())))
     else:
         logger.debug('future ocr')
-        result = engine.ocr_process(os.path.join(OCR_IMAGE_STORE_PATH, 'sigma-ocr.json'), image_dir, threshold, patient_id)
-    logger.info('ocr result: {}'.format(result))
+        result = engine.ocr_process(os.path.join(OCR_IMAGE_STORE_PATH, 'sigma-ocr.json'), images, threshold, patient_id, image_dir, stats)
+    logger.info('ocr result: {}, stats: {}'.format(result, stats))
+    return result, stats
+
+
+def run_ocr_job(images, threshold, patient_id):
+    result, stats = run_ocr(images, threshold, patient_id)
+    return {"data": result, "stats": stats}
+
+
+@app.route("/ocr/", methods=["POST"])
+def ocr():
+    """OCR process."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": ""}
+    result, stats = run_ocr(*read_ocr_request())
     response["data"] = result
+    response["stats"] = stats
     response["message"] = "get optical character successfully!"
     response["message_chs"] = "字符识别成功!"
     return make_response(json.dumps(response), 200)
 
 
+@app.route("/ocr/jobs", methods=["POST"])
+def submit_ocr_job():
+    """Queue an OCR process, the result is polled from /ocr/jobs/<job_id>."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": None}
+    images, threshold, patient_id = read_ocr_request()
+    if not images:
+        response["error"]["code"] = "InvalidInput"
+        response["error"]["message"] = "The request argument was missing"
+        response["error"]["message_chs"] = "缺少参数!"
+        return make_response(json.dumps(response), 400)
+    try:
+        job_id = get_jobs().submit(run_ocr_job, images, threshold, patient_id)
+    except QueueFullError as e:
+        logger.warning(e)
+        response["error"]["code"] = "TooManyRequests"
+        response["error"]["message"] = "OCR queue is full, please retry later"
+        response["error"]["message_chs"] = "识别队列已满, 请稍后重试!"
+        return make_response(json.dumps(response), 429, {"Retry-After": "1"})
+    response["data"] = {"job_id": job_id, "status": "queued"}
+    response["message"] = "Submit OCR job successfully!"
+    response["message_chs"] = "提交识别任务成功!"
+    return make_response(json.dumps(response), 202, {"Location": "/ocr/jobs/{}".format(job_id)})
+
+
+@app.route("/ocr/jobs/<string:job_id>", methods=["GET"])
+def get_ocr_job(job_id):
+    """Get an OCR job, `wait` seconds long polls until it is done."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": None}
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), OCR_JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    job = get_jobs().get(job_id, wait)
+    if job is None:
+        response["error"]["code"] = "NotFound"
+        response["error"]["message"] = "OCR job not found"
+        response["error"]["message_chs"] = "识别任务不存在!"
+        return make_response(json.dumps(response), 404)
+    response["data"] = job
+    response["message"] = "Get OCR job successfully!"
+    response["message_chs"] = "获取识别任务成功!"
+    return make_response(json.dumps(response), 200)
+
+
+@app.route("/ocr/batch", methods=["POST"])
+def ocr_batch():
+    """OCR many independent strips, each with its own mode and threshold."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": None}
+    file_storages = request.files.getlist('file')
+    if not file_storages:
+        response["error"]["code"] = "InvalidInput"
+        response["error"]["message"] = "The request argument was missing"
+        response["error"]["message_chs"] = "缺少参数!"
+        return make_response(json.dumps(response), 400)
+    items = []
+    for file_storage in file_storages:
+        file_name = file_storage.filename
+        thres = request.form.get('threshold+{}'.format(file_name))
+        try:
+            thres = int(thres) if thres else None
+        except ValueError:
+            response["error"]["code"] = "InvalidInput"
+            response["error"]["message"] = "Invalid threshold of {}".format(file_name)
+            response["error"]["message_chs"] = "阈值无效!"
+            return make_response(json.dumps(response), 400)
+        mode = request.form.get('mode+{}'.format(file_name)) or ('apply' if thres is not None else 'legacy')
+        items.append({"name": file_name, "buf": file_storage.read(), "mode": mode, "threshold": thres})
+    image_dir = None
+    if OCR_DEBUG:
+        image_dir = tempfile.mkdtemp(dir=workspace())
+        logger.info('OCR batch image_dir: {}'.format(image_dir))
+    results = get_engine().ocr_batch(os.path.join(OCR_IMAGE_STORE_PATH, 'sigma-ocr.json'), items, image_dir)
+    logger.info('ocr batch results: {}'.format(results))
+    response["data"] = results
+    response["message"] = "get optical character successfully!"
+    response["message_chs"] = "字符识别成功!"
+    return make_response(json.dumps(response), 200)
+
+
+@app.route("/ocr/cache", methods=["GET"])
+def ocr_cache():
+    """OCR result cache hit/miss counters."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": None}
+    response["data"] = get_engine().cache_info()
+    response["message"] = "Get cache statistics successfully!"
+    response["message_chs"] = "获取缓存统计成功!"
+    return make_response(json.dumps(response), 200)
+
+
+@app.route("/ocr/model", methods=["GET"])
+def ocr_model():
+    """Classifier model version and file hash."""
+    response = {"message": "", "message_chs": "", "error": {"code": "", "message": "", "message_chs": ""}, "data": None}
+    response["data"] = get_engine().model_info()
+    response["message"] = "Get model information successfully!"
+    response["message_chs"] = "获取模型信息成功!"
+    return make_response(json.dumps(response), 200)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Stage latencies and counters of this process in the Prometheus text format."""
+    if not metrics.is_enabled():
+        return make_response("metrics are disabled, set ocr.metrics in conf/ocr.yml\n", 404, {"Content-Type": "text/plain"})
+    return make_response(metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=HTTP_PORT_SERVICE, debug=False)
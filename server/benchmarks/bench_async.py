@@ -0,0 +1,84 @@
+# -*- coding=utf-8 -*-
+"""Benchmark the calls Query.get_series sends for one request: get_count of the finished records and get_job
+of the waiting ones, in sequence, on a thread pool and on the asynchronous client.
+
+Runs against benchmarks.stub_upstream with an injected latency and checks that every mode answers the same.
+
+Run from the server folder:
+    python -m benchmarks.bench_async --finished 8 --waiting 4 --latency 0.05
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_upstream import ACCOUNT, KEY, SECRET
+from benchmarks.stub_upstream import StubServer
+from ocr.sigma.request.asyncclient import AsyncRequest
+from ocr.sigma.request.sigmacloud import CloudRequest
+from ocr.sigma.request.sigmaserver import ServerRequest
+
+
+def workload(finished, waiting):
+    return ([('get_count', '1.2.840.{}'.format(i), 'Nodules') for i in range(finished)] +
+            [('get_job', 'job{}'.format(i)) for i in range(waiting)])
+
+
+def _plain(answers):
+    return [{'error': repr(answer)} if isinstance(answer, Exception) else answer for answer in answers]
+
+
+def run(client, calls, rounds, executor=None):
+    """gather the calls `rounds` times, returns ms per round and the answers of the last one."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        answers = client.gather(calls, executor)
+    return (time.perf_counter() - start) / rounds * 1000, _plain(answers)
+
+
+def bench(name, create, calls, rounds, workers):
+    report = {}
+    sync = create()
+    report['sequential_ms'], expected = run(sync, calls, rounds)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        report['threads_ms'], threads = run(sync, calls, rounds, executor)
+    report['sync_connections'] = sync.connection_stats()
+    sync.close()
+    client = AsyncRequest(create())
+    report['async_ms'], answers = run(client, calls, rounds)
+    report['async_connections'] = client.connection_stats()
+    client.close()
+    assert threads == expected and answers == expected, '{} answers differ between modes'.format(name)
+    report['errors'] = sum(isinstance(answer, dict) and 'error' in answer for answer in expected)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the upstream calls of one series query')
+    parser.add_argument('--finished', type=int, default=8, help='get_count calls per request')
+    parser.add_argument('--waiting', type=int, default=4, help='get_job calls per request')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the stub waits before answering')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4, help='threads of the sync client')
+    parser.add_argument('--pool-size', type=int, default=10, help='connections of every client')
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    calls = workload(args.finished, args.waiting)
+    options = dict(access_key=KEY, secret_key=SECRET, pool_size=args.pool_size)
+    report = {
+        'calls': len(calls),
+        'latency_s': args.latency,
+        'server': bench('server', lambda: ServerRequest(stub.endpoint, **options), calls, args.rounds, args.workers),
+        'cloud': bench('cloud', lambda: CloudRequest(stub.endpoint, account=ACCOUNT, **options), calls, args.rounds,
+                       args.workers),
+    }
+    stub.shutdown()
+    stub.server_close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# -*- coding=utf-8 -*-
+"""Benchmark SQLite.find on a generated autorun.db: reference string-built SQL with a Python sort vs the
+bound-parameter query with indexes and ORDER BY ... LIMIT 1.
+
+Run from the server folder:
+    python -m benchmarks.bench_autorun --rows 2000000
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from ocr.sigma.database.autorun import SQLite
+
+SCHEMA = ("CREATE TABLE autorun (id INTEGER PRIMARY KEY, patient_id TEXT, accession_number TEXT, "
+          "study_instance_uid TEXT, series_instance_uid TEXT, status TEXT, type TEXT, job_id TEXT, datetime TEXT)")
+STATUSES = ('waiting', 'computing', 'succeed', 'pushed', 'failed')
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _rows(count, seed):
+    rng = random.Random(seed)
+    patients = max(1, count // 3)
+    for i in range(count):
+        patient = rng.randrange(patients)
+        study = '1.2.840.{}.{}'.format(patient, rng.randrange(2))
+        stamp = '{}, {:02d} {} {} {:02d}:{:02d}:{:02d} GMT'.format(
+            rng.choice(DAYS), rng.randint(1, 28), rng.choice(MONTHS), rng.randint(2016, 2019),
+            rng.randrange(24), rng.randrange(60), rng.randrange(60))
+        yield (i + 1, 'P{:08d}'.format(patient), 'A{:08d}'.format(patient), study, '{}.{}'.format(study, i),
+               rng.choice(STATUSES), 'lung', 'job{}'.format(i), stamp)
+
+
+def generate(db_name, rows, seed=0):
+    """Write an autorun.db with rows records and no index, like the table autorun creates."""
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    with sqlite3.connect(db_name) as client:
+        client.execute(SCHEMA)
+        client.executemany("INSERT INTO autorun VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", _rows(rows, seed))
+
+
+def reference_find(cursor, latest=True, **kwargs):
+    """The former SQLite.find: interpolated SQL, every matching row fetched and sorted in Python."""
+    command = "SELECT * FROM autorun WHERE "
+    queries = []
+    if kwargs.get("series_instance_uid") is not None:
+        queries.append("series_instance_uid='%s'" % kwargs.get("series_instance_uid"))
+    if kwargs.get("study_instance_uid") is not None:
+        queries.append("study_instance_uid='%s'" % kwargs.get("study_instance_uid"))
+    if kwargs.get("patient_id") is not None:
+        queries.append("patient_id='%s' COLLATE NOCASE" % kwargs.get("patient_id"))
+    command += " and ".join(queries)
+    result = cursor.execute(command).fetchall()
+    if latest and len(result) > 1:
+        return [sorted(result, key=lambda x: time.strptime(x['datetime'], '%a, %d %b %Y %H:%M:%S GMT'), reverse=True)[0]]
+    return result
+
+
+def queries(rows, count, seed):
+    rng = random.Random(seed + 1)
+    patients = max(1, rows // 3)
+    out = []
+    for _ in range(count):
+        patient = rng.randrange(patients)
+        kind = rng.randrange(3)
+        if kind == 0:
+            kwargs = {'patient_id': 'p{:08d}'.format(patient)}
+        elif kind == 1:
+            kwargs = {'study_instance_uid': '1.2.840.{}.0'.format(patient)}
+        else:
+            kwargs = {'series_instance_uid': '1.2.840.{}.0.{}'.format(patient, rng.randrange(rows))}
+        out.append((rng.random() < 0.8, kwargs))
+    return out
+
+
+def timed(func, workload):
+    start = time.perf_counter()
+    results = [func(latest, **kwargs) for latest, kwargs in workload]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQLite.find on a generated autorun.db')
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='autorun.db to generate, a temporary file by default')
+    args = parser.parse_args()
+
+    db_name = args.db or os.path.join(tempfile.mkdtemp(prefix='bench-autorun-'), 'autorun.db')
+    start = time.perf_counter()
+    generate(db_name, args.rows, args.seed)
+    generate_time = time.perf_counter() - start
+    workload = queries(args.rows, args.queries, args.seed)
+
+    client = sqlite3.connect(db_name)
+    client.row_factory = SQLite.dict_factory
+    reference_time, reference = timed(lambda latest, **kw: reference_find(client.cursor(), latest, **kw), workload)
+    client.close()
+
+    start = time.perf_counter()
+    database = SQLite(db_name)
+    index_time = time.perf_counter() - start
+    find_time, found = timed(database.find, workload)
+    database.close()
+
+    assert found == reference, 'SQLite.find differs from the reference'
+    report = {
+        'rows': args.rows,
+        'queries': len(workload),
+        'generate_s': generate_time,
+        'index_s': index_time,
+        'reference_ms_per_query': reference_time / len(workload) * 1000,
+        'find_ms_per_query': find_time / len(workload) * 1000,
+        'speedup': reference_time / find_time if find_time else 0,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding=utf-8 -*-
+"""Benchmark reading the lesion count of a result json: get_json and reference_count, which load the whole
+document, vs get_count, which streams it into a CountScanner and stops at the count.
+
+Runs against benchmarks.stub_upstream serving large result json, whose lesions hold `--contour` points each,
+for the first field of the document (Nodules) and the last one (lesion). Checks that both read the same count,
+and reports the time per call, the peak of memory allocated by one call and the connections the stub accepted.
+
+Run from the server folder:
+    python -m benchmarks.bench_count --calls 50 --contour 20000
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.bench_upstream import ACCOUNT, KEY, SECRET
+from benchmarks.stub_upstream import StubServer, result_body
+from ocr.sigma.request.asyncclient import AsyncRequest
+from ocr.sigma.request.sigmacloud import CloudRequest
+from ocr.sigma.request.sigmaserver import ServerRequest
+
+FIELDS = ('Nodules', 'lesion')
+
+
+def reference_count(json_object, field):
+    """The count read from the loaded result json, as the statistics handlers did before get_count."""
+    return int(json_object.get(field, {}).get('count', 0))
+
+
+def unique_ids(count):
+    """Ids of result json with lesions, few enough for the stub to keep their bodies cached."""
+    ids = ['1.2.840.{}'.format(i) for i in range(64)]
+    return [uid for uid in ids if sum(bytearray(uid.encode())) % 7][:count]
+
+
+def peak_kb(func, unique_id):
+    tracemalloc.start()
+    try:
+        func(unique_id)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(stub, func, ids, calls):
+    """Call func(unique_id) `calls` times over the ids, returns the timings, the counts read and the stub
+    connections."""
+    stub.stats.update(connections=0, requests=0, failures=0)
+    start = time.perf_counter()
+    counts = [func(ids[i % len(ids)]) for i in range(calls)]
+    seconds = time.perf_counter() - start
+    return {
+        'ms_per_call': seconds / calls * 1000,
+        'upstream_connections': stub.stats['connections'],
+        'peak_kb': peak_kb(func, ids[0]),
+    }, counts
+
+
+def bench(stub, client, ids, calls):
+    report = {}
+    for field in FIELDS:
+        full, expected = run(stub, lambda uid: reference_count(client.get_json(uid), field), ids, calls)
+        stream, counts = run(stub, lambda uid: client.get_count(uid, field), ids, calls)
+        assert counts == expected, 'get_count differs from get_json for {}'.format(field)
+        report[field] = {'get_json': full, 'get_count': stream,
+                         'speedup': full['ms_per_call'] / stream['ms_per_call'] if stream['ms_per_call'] else 0}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the streamed lesion count against a local stub')
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--contour', type=int, default=20000, help='contour points of every lesion')
+    parser.add_argument('--padding', type=int, default=0, help='extra bytes at the end of every result json')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='also run the asynchronous client')
+    args = parser.parse_args()
+
+    stub = StubServer(padding=args.padding, contour=args.contour).start()
+    ids = unique_ids(8)
+    sizes = [len(result_body(uid, args.padding, args.contour)) for uid in ids]
+    report = {'calls': args.calls, 'contour': args.contour, 'json_kb': sum(sizes) / len(sizes) / 1024}
+    backends = {
+        'server': lambda: ServerRequest(stub.endpoint, access_key=KEY, secret_key=SECRET),
+        'cloud': lambda: CloudRequest(stub.endpoint, access_key=KEY, secret_key=SECRET, account=ACCOUNT),
+    }
+    for name, create in backends.items():
+        clients = {'sync': create()}
+        if args.use_async:
+            clients['async'] = AsyncRequest(create())
+        for mode, client in clients.items():
+            report['{}_{}'.format(name, mode)] = bench(stub, client, ids, args.calls)
+            client.close()
+    stub.shutdown()
+    stub.server_close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
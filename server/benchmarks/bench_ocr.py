@@ -0,0 +1,173 @@
+# -*- coding=utf-8 -*-
+"""Benchmark the OCR engine on the synthetic corpus of benchmarks.corpus.
+
+Runs imagefile_to_digit_string, SigmaOCR.ocr_setup and SigmaOCR.ocr_apply and reports, per mode, the
+throughput, p50/p95/p99 latency, time per pipeline stage and accuracy against the ground truth as JSON,
+so that runs can be compared between commits.
+
+Run from the server folder:
+    python -m benchmarks.bench_ocr --output report.json
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import corpus
+from ocr import metrics
+from ocr.engine import SigmaOCR
+from ocr.engine.image2string import imagefile_to_digit_string
+from ocr.engine.sigmaOCRAPI import MODELS
+from ocr.engine.tesseract import ENGINE_SUBPROCESS, create_engine
+
+
+class ModeResult(object):
+    """Latencies and outcomes of one benchmarked mode."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.correct = 0
+        self.errors = 0
+        self.first_error = ''
+        self.start = time.perf_counter()
+
+    def run(self, expected, func, *args):
+        """Time func(*args), returns its result or None if it raised."""
+        start = time.perf_counter()
+        try:
+            text = func(*args)
+        except Exception as e:
+            self.latencies.append(time.perf_counter() - start)
+            self.errors += 1
+            self.first_error = self.first_error or '{}: {}'.format(type(e).__name__, e)
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        # ocr_setup answers (text, threshold)
+        if (text[0] if isinstance(text, tuple) else text) == expected:
+            self.correct += 1
+        return text
+
+    def report(self):
+        wall = time.perf_counter() - self.start
+        calls = len(self.latencies)
+        p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99]).tolist() if calls else (0, 0, 0)
+        stages = {labels['stage']: {'count': count, 'seconds': total}
+                  for labels, count, total in metrics.REGISTRY.totals(metrics.STAGE_SECONDS)}
+        return {
+            'calls': calls,
+            'seconds': wall,
+            'throughput': calls / wall if wall else 0,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000,
+            'accuracy': self.correct / calls if calls else 0,
+            'errors': self.errors,
+            'first_error': self.first_error,
+            'stages': stages,
+        }
+
+
+def _read(corpus_dir, name):
+    with open(os.path.join(corpus_dir, name), 'rb') as f:
+        return f.read()
+
+
+def bench_imagefile(manifest, corpus_dir, engine):
+    result = ModeResult('imagefile_to_digit_string')
+    for case in manifest:
+        for name in [case['setup']] + case['apply']:
+            result.run(case['text'], imagefile_to_digit_string, os.path.join(corpus_dir, name), '0123456789', True, engine)
+    return result
+
+
+def bench_setup(manifest, corpus_dir, ocr, work_dir):
+    """Set up every case from its setup strip, returns the result and the column threshold of every case."""
+    result = ModeResult('ocr_setup')
+    thresholds = {}
+    for case in manifest:
+        json_file = os.path.join(work_dir, 'case{:04d}.json'.format(case['case']))
+        ocr.reset(json_file)
+        images = {case['setup']: _read(corpus_dir, case['setup'])}
+        answer = result.run(case['text'], ocr.ocr_setup, json_file, images, case['text'])
+        if isinstance(answer, tuple) and os.path.isfile(json_file):
+            thresholds[case['case']] = answer[1]
+    return result, thresholds
+
+
+def bench_apply(manifest, corpus_dir, ocr, work_dir, thresholds):
+    result = ModeResult('ocr_apply')
+    for case in manifest:
+        if case['case'] not in thresholds:
+            continue
+        json_file = os.path.join(work_dir, 'case{:04d}.json'.format(case['case']))
+        images = {name: _read(corpus_dir, name) for name in case['apply']}
+        threshold = {name: thresholds[case['case']] for name in case['apply']}
+        result.run(case['text'], ocr.ocr_apply, json_file, images, threshold)
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the OCR engine on a synthetic ID-strip corpus')
+    parser.add_argument('--corpus', help='existing corpus folder, generated into a temporary folder if missing')
+    parser.add_argument('--cases', type=int, default=20, help='patient IDs of a generated corpus')
+    parser.add_argument('--strips', type=int, default=4, help='apply strips per patient ID of a generated corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', default=ENGINE_SUBPROCESS, help='tesseract backend')
+    parser.add_argument('--workers', type=int, default=1, help='SigmaOCR worker threads')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench-ocr-')
+    corpus_dir = args.corpus or os.path.join(work_dir, 'corpus')
+    if not args.corpus:
+        corpus.generate(corpus_dir, args.cases, args.strips, args.seed)
+    manifest = corpus.load(corpus_dir)
+
+    ocr = SigmaOCR()
+    ocr.set_whitelist_char('0123456789')
+    ocr.set_engine(args.engine, args.workers)
+    ocr.set_workers(args.workers)
+    metrics.enable(True)
+
+    modes = {}
+    metrics.REGISTRY.reset()
+    modes['imagefile_to_digit_string'] = bench_imagefile(manifest, corpus_dir, create_engine(args.engine)).report()
+    metrics.REGISTRY.reset()
+    setup, thresholds = bench_setup(manifest, corpus_dir, ocr, work_dir)
+    modes['ocr_setup'] = setup.report()
+    # load the classifier model outside the timed calls
+    MODELS.get()
+    metrics.REGISTRY.reset()
+    modes['ocr_apply'] = bench_apply(manifest, corpus_dir, ocr, work_dir, thresholds).report()
+
+    report = {
+        'commit': _commit(),
+        'corpus': {'path': corpus_dir, 'cases': len(manifest), 'seed': args.seed},
+        'engine': args.engine,
+        'workers': args.workers,
+        'modes': modes,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
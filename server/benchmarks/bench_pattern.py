@@ -0,0 +1,74 @@
+# -*- coding=utf-8 -*-
+"""Benchmark pattern matching: expanded pattern list vs compiled PatternAutomaton.
+
+Run from the server folder:
+    python -m benchmarks.bench_pattern
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import random
+import time
+
+from ocr.engine.pattern import ConvertStrToPatternList, PatternMatching
+
+PATTERNS = [
+    '[ZS]d(2,8)L(1,3)d(4,10)',
+    'd(1,12)L(1,4)d(1,12)',
+    'L(1,3)d(1,10)L(1,3)d(1,10)',
+]
+
+ALPHABET = '0123456789ABDGIJOSTZ'
+
+
+def random_pids(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(6, 20))) for _ in range(count)]
+
+
+def bench(pattern_str, pids):
+    converter = ConvertStrToPatternList(pattern_str)
+    converter.process()
+
+    start = time.perf_counter()
+    pattern_list = converter.get_pattern_list()
+    expand_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    automaton = converter.get_automaton()
+    compile_time = time.perf_counter() - start
+
+    results = {}
+    for name, patterns in (('expanded', pattern_list), ('automaton', automaton)):
+        start = time.perf_counter()
+        best = []
+        for pid in pids:
+            match = PatternMatching(pid, patterns)
+            match.process()
+            best.append(match.get_potential_result()[:1])
+        results[name] = (time.perf_counter() - start, best)
+
+    assert results['expanded'][1] == results['automaton'][1], 'automaton result differs for {}'.format(pattern_str)
+    return {
+        'pattern': pattern_str,
+        'expanded_patterns': len(pattern_list),
+        'expand_ms': expand_time * 1000,
+        'compile_ms': compile_time * 1000,
+        'expanded_match_us': results['expanded'][0] / len(pids) * 1e6,
+        'automaton_match_us': results['automaton'][0] / len(pids) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200, help='recognized strings per pattern')
+    parser.add_argument('--pattern', action='append', help='pattern to benchmark, repeatable')
+    args = parser.parse_args()
+    pids = random_pids(args.count)
+    report = [bench(p, pids) for p in (args.pattern or PATTERNS)]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# -*- coding=utf-8 -*-
+"""Benchmark the signing of one upstream call: the former ServerRequest and SigmaAuth signing, which hashed
+the secret and canonicalized the url on every call and logged on the way, vs the Signer with its prepared
+HMAC key and the resources canonicalized once per url template.
+
+Checks that both give the same Authorization header for every call before timing them.
+
+Run from the server folder:
+    python -m benchmarks.bench_signing --calls 20000
+"""
+from __future__ import absolute_import
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+from ocr.sigma.request.sigmacloud import CloudRequest, canonicalize_resource, extract_resource_from_url, format_header
+from ocr.sigma.request.sigmaserver import ServerRequest
+
+KEY = 'c6X7d2MUKiY26Xm8nuTX5w=='
+SECRET = 'D52lRKO2870hGUFKA2dKkhdSsaI='
+ACCOUNT = 'sigma'
+ENDPOINT = 'http://127.0.0.1:7070'
+DATE = 'Sun, 18 Oct 2026 08:49:37 GMT'
+
+_logger = logging.getLogger('benchmarks.bench_signing')
+
+
+def _utf8(content):
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def reference_server_sign(secret, verb, headers, url):
+    """The former AbstractRequest._gen_sign."""
+    parsed_headers = dict()
+    for key in headers.keys():
+        content = _utf8(headers[key])
+        if key.lower().startswith("x-sigma-"):
+            parsed_headers[key.lower().strip()] = content
+        else:
+            parsed_headers[key.strip()] = content
+    headers = parsed_headers
+    content_type = headers.get("Content-Type", "")
+    content_md5 = headers.get("Content-Md5", "")
+    date = headers.get("Date", "")
+    if not date:
+        raise ValueError("Http Date header is empty")
+    if isinstance(date, bytes):
+        date = date.decode("utf-8")
+    if isinstance(content_type, bytes):
+        content_type = content_type.decode("utf-8")
+    if isinstance(content_md5, bytes):
+        content_md5 = content_md5.decode("utf-8")
+    canonicalized_headers = "\n".join("%s:%s" % (key, headers[key].strip())
+                                      for key in sorted(headers.keys()) if key.startswith("x-sigma-"))
+    parsed = urlsplit(url)
+    if not parsed.query:
+        canonicalized_resource = url[(len(parsed.scheme) + 3):].strip()
+    else:
+        canonicalized_resource = parsed.netloc + parsed.path + "?" + "&".join(sorted(parsed.query.split("&")))
+    if canonicalized_headers:
+        canonicalized = canonicalized_headers + "\n" + canonicalized_resource
+    else:
+        canonicalized = canonicalized_resource
+    sign = "\n".join([verb, content_md5, content_type, date, canonicalized])
+    digest = hmac.new(secret.encode(), sign.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).strip().decode("utf-8")
+
+
+def reference_cloud_sign(access_key_id, access_key_secret, method, url, headers):
+    """The former SigmaAuth.__call__ with verbose on, headers holding the Date."""
+    _logger.debug("Initialize SigmaAuth, access key id: " + access_key_id +
+                  ", access key secret: " + access_key_secret)
+    content_type = headers.get('Content-Type', '')
+    content_md5 = headers.get('Content-MD5', '')
+    canonicalized_gd_headers = ""
+    date = headers['Date']
+    resource = extract_resource_from_url(url)
+    tmp_headers = format_header(headers)
+    for k in tmp_headers.keys():
+        if k.startswith("x-sigma-"):
+            canonicalized_gd_headers += "%s:%s\n" % (k, tmp_headers[k])
+    canonicalized_resource = canonicalize_resource(resource)
+    _logger.debug("Canonicalized resource: " + canonicalized_resource)
+    string_to_sign = method + "\n" + content_md5 + "\n" + content_type + "\n" + date + "\n" + canonicalized_gd_headers + canonicalized_resource
+    _logger.debug("String to Sign: " + string_to_sign)
+    h = hmac.new(access_key_secret.encode(), string_to_sign.encode(), hashlib.sha256)
+    signature = base64.b64encode(h.digest()).strip().decode("utf-8")
+    headers["Authorization"] = "12Sigma " + access_key_id + ":" + signature
+    _logger.info("Authorization header: " + headers["Authorization"])
+    return headers["Authorization"]
+
+
+def unique_ids(count, seed):
+    rng = random.Random(seed)
+    ids = ['1.2.840.{}.{}.{}'.format(rng.randrange(10 ** 6), rng.randrange(10 ** 6), i) for i in range(count)]
+    # values the templates cannot take, canonicalized in full
+    ids[::97] = ['a&b=c?d#e {}'.format(i) for i in range(len(ids[::97]))]
+    return ids
+
+
+def server_calls(server, ids):
+    """(reference, new) Authorization of the two ServerRequest calls for every id."""
+    def reference(uid):
+        for template in ('{}/jobs?unique_id={}', '{}/data/downloads/{}?format=json&category=original'):
+            headers = {"Content-Type": "application/json", "Date": DATE}
+            yield "12Sigma " + KEY + ":" + reference_server_sign(SECRET, "GET", headers, template.format(ENDPOINT, uid))
+
+    def new(uid):
+        for template in ('{}/jobs?unique_id={}', '{}/data/downloads/{}?format=json&category=original'):
+            headers = {"Content-Type": "application/json", "Date": DATE}
+            server._sign_url("GET", headers, template, uid)
+            yield headers["Authorization"]
+
+    return reference, new
+
+
+def cloud_calls(cloud, ids):
+    templates = ('{}/accounts/{}/jobs/{}/?queue_info=true', '{}/accounts/{}/store/downloads/?filename={}.json')
+
+    def reference(uid):
+        for template in templates:
+            headers = {'Content': 'application/json', 'Date': DATE}
+            yield reference_cloud_sign(KEY, SECRET, "GET", template.format(ENDPOINT, ACCOUNT, uid), headers)
+
+    def new(uid):
+        for template in templates:
+            headers = {'Content': 'application/json', 'Date': DATE}
+            cloud._sign_url("GET", headers, template, ACCOUNT, uid)
+            yield headers["Authorization"]
+
+    return reference, new
+
+
+def timed(func, ids):
+    start = time.perf_counter()
+    signatures = [signature for uid in ids for signature in func(uid)]
+    return time.perf_counter() - start, signatures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the signing of upstream calls')
+    parser.add_argument('--calls', type=int, default=20000, help='ids signed, two calls each')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='INFO', help='level of the logging the former signing went through')
+    args = parser.parse_args()
+    # the service logs to files, the former SigmaAuth logged every Authorization header at info
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.FileHandler(os.devnull))
+    root.setLevel(args.log_level)
+
+    ids = unique_ids(args.calls, args.seed)
+    backends = {
+        'server': server_calls(ServerRequest(ENDPOINT, access_key=KEY, secret_key=SECRET), ids),
+        'cloud': cloud_calls(CloudRequest(ENDPOINT, access_key=KEY, secret_key=SECRET, account=ACCOUNT), ids),
+    }
+    report = {'calls': args.calls * 2, 'log_level': args.log_level}
+    for name, (reference, new) in backends.items():
+        reference_time, expected = timed(reference, ids)
+        new_time, signatures = timed(new, ids)
+        assert signatures == expected, '{} signatures differ from the reference'.format(name)
+        report[name] = {
+            'reference_us_per_call': reference_time / len(expected) * 1e6,
+            'signer_us_per_call': new_time / len(expected) * 1e6,
+            'speedup': reference_time / new_time if new_time else 0,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding=utf-8 -*-
+"""Benchmark ServerRequest and CloudRequest against benchmarks.stub_upstream.
+
+Compares the former calls, one module-level requests.get and so one connection per call, with the backends
+keeping their connections alive, and reports the time per call, the connections opened and the calls that
+failed, without and with injected 503 answers.
+
+Run from the server folder:
+    python -m benchmarks.bench_upstream --calls 500
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import time
+
+import requests
+
+from benchmarks.stub_upstream import StubServer, result_json
+from ocr.sigma.request.sigmacloud import CloudRequest, SigmaAuth
+from ocr.sigma.request.sigmaserver import ServerRequest
+
+KEY = 'c6X7d2MUKiY26Xm8nuTX5w=='
+SECRET = 'D52lRKO2870hGUFKA2dKkhdSsaI='
+ACCOUNT = 'sigma'
+
+
+def reference_server_json(backend, unique_id):
+    """The former ServerRequest.get_json."""
+    headers = {"Content-Type": "application/json", "Date": backend._get_gmt_time()}
+    url = '{}/data/downloads/{}?format=json&category=original'.format(backend.endpoint, unique_id)
+    headers["Authorization"] = backend._get_auth(backend.access_key, backend.secret_key, "GET", headers, url)
+    response = requests.get(url, headers=headers)
+    if response.status_code // 100 == 2:
+        return json.loads(response.text)
+    raise ValueError(response.text)
+
+
+def reference_cloud_json(backend, unique_id):
+    """The former CloudRequest.get_json, a SigmaAuth per call."""
+    headers = {'Content': 'application/json'}
+    url = '{}/accounts/{}/store/downloads/?filename={}.json'.format(backend.endpoint, backend.account, unique_id)
+    resp1 = requests.get(url, headers=headers, auth=SigmaAuth(backend.access_key, backend.secret_key, False))
+    if resp1.status_code // 100 != 2:
+        raise ValueError(resp1.text)
+    url = '{}&download_id={}'.format(url, json.loads(resp1.text)['download_id'])
+    resp2 = requests.get(url, headers=headers, auth=SigmaAuth(backend.access_key, backend.secret_key, False))
+    if resp2.status_code // 100 != 2:
+        raise ValueError(resp2.text)
+    return json.loads(resp2.text)
+
+
+def run(stub, func, calls):
+    """Call func(unique_id) `calls` times, returns the timings, failures and the connections the stub accepted."""
+    stub.stats.update(connections=0, requests=0, failures=0)
+    wrong = errors = 0
+    start = time.perf_counter()
+    for i in range(calls):
+        unique_id = '1.2.840.{}'.format(i)
+        try:
+            if func(unique_id) != result_json(unique_id, stub.padding, stub.contour):
+                wrong += 1
+        except Exception:
+            errors += 1
+    seconds = time.perf_counter() - start
+    return {
+        'ms_per_call': seconds / calls * 1000,
+        'errors': errors,
+        'wrong': wrong,
+        'upstream_requests': stub.stats['requests'],
+        'upstream_connections': stub.stats['connections'],
+        'injected_failures': stub.stats['failures'],
+    }
+
+
+def bench(stub, calls):
+    server = ServerRequest(stub.endpoint, access_key=KEY, secret_key=SECRET, retries=3, backoff=0.001)
+    cloud = CloudRequest(stub.endpoint, access_key=KEY, secret_key=SECRET, account=ACCOUNT, retries=3, backoff=0.001)
+    report = {
+        'server_reference': run(stub, lambda uid: reference_server_json(server, uid), calls),
+        'server_session': run(stub, server.get_json, calls),
+        'cloud_reference': run(stub, lambda uid: reference_cloud_json(cloud, uid), calls),
+        'cloud_session': run(stub, cloud.get_json, calls),
+    }
+    report['server_session']['client'] = server.connection_stats()
+    report['cloud_session']['client'] = cloud.connection_stats()
+    server.close()
+    cloud.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sigma request backends against a local stub')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub waits before answering')
+    parser.add_argument('--padding', type=int, default=0, help='extra bytes in every result json')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='share of 503 answers of the second run')
+    args = parser.parse_args()
+
+    report = {'calls': args.calls}
+    for name, fail_rate in (('healthy', 0.0), ('failing', args.fail_rate)):
+        stub = StubServer(latency=args.latency, fail_rate=fail_rate, padding=args.padding).start()
+        report[name] = bench(stub, args.calls)
+        stub.shutdown()
+        stub.server_close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# -*- coding=utf-8 -*-
+"""Check the OCR result cache key, sigmaOCRAPI.strip_digest, on the filtered strips of the synthetic corpus.
+
+The key must follow the exact pixels tesseract reads. Asserts that a copy of a strip, contiguous or not, gets the
+same key, that a one gray level change on a single pixel, gray noise keeping the Otsu binarization, or another
+dtype gets another key, and that no key is shared by strips of different patient IDs.
+
+Run from the server folder:
+    python -m benchmarks.check_cache_key --cases 15
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import skimage.io
+from skimage import filters
+
+from benchmarks import corpus
+from ocr.engine.image2string import image_filter
+from ocr.engine.sigmaOCRAPI import strip_digest
+
+
+def one_level(rng, img):
+    """One pixel one gray level up or down."""
+    noisy = img.astype(int)
+    index = rng.randint(noisy.size)
+    # a saturated pixel moves inwards, so that the strip always changes
+    noisy.flat[index] += -1 if noisy.flat[index] == 255 else 1
+    return noisy.astype(np.uint8)
+
+
+def same_binarization(img):
+    """The strip with a pixel moved one level on its side of the Otsu threshold, if one can be, else None."""
+    threshold = filters.threshold_otsu(img) if img.min() != img.max() else img.min()
+    noisy = img.astype(int)
+    movable = np.flatnonzero((noisy > threshold + 1) | ((noisy <= threshold - 1) & (noisy > 0)))
+    if not len(movable):
+        return None
+    noisy.flat[movable[0]] -= 1
+    return noisy.astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the OCR result cache key follows the exact strip')
+    parser.add_argument('--corpus', help='corpus folder, a temporary one is rendered if not given')
+    parser.add_argument('--cases', type=int, default=15, help='patient IDs of a rendered corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        manifest = corpus.load(corpus_dir) if args.corpus else corpus.generate(tmp, args.cases, seed=args.seed)
+        strips = [(case['text'], image_filter(skimage.io.imread(os.path.join(corpus_dir, name)), False))
+                  for case in manifest for name in [case['setup']] + case['apply']]
+
+    texts = {}
+    binarization_checked = 0
+    for text, img in strips:
+        key = strip_digest(img)
+        texts.setdefault(key, set()).add(text)
+        assert strip_digest(img.copy()) == key, 'a copy changed the key of a strip of {}'.format(text)
+        assert strip_digest(np.asfortranarray(img)) == key, 'memory layout changed the key of {}'.format(text)
+        assert strip_digest(one_level(rng, img)) != key, 'one gray level kept the key of a strip of {}'.format(text)
+        assert strip_digest(img.astype(np.int32)) != key, 'another dtype kept the key of a strip of {}'.format(text)
+        noisy = same_binarization(img)
+        if noisy is not None:
+            assert strip_digest(noisy) != key, 'gray noise kept the key of a strip of {}'.format(text)
+            binarization_checked += 1
+    shared = [sorted(shared) for shared in texts.values() if len(shared) > 1]
+    assert not shared, 'keys shared by different patient IDs: {}'.format(shared)
+
+    report = {
+        'strips': len(strips),
+        'keys': len(texts),
+        'exact_key': True,
+        'same_binarization_checked': binarization_checked,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding=utf-8 -*-
+"""Check the vectorized image2string._get_extent against the per-pixel double loop it replaced.
+
+Renders the synthetic strip corpus (or reads one with --corpus), applies the grayscale, bounding box removal and
+Otsu steps of image_filter, and asserts that both give the same extents and counts on `img_mask == 0` and
+`img_mask == 255`, and so the same crop box and background decision. Blank and full masks are checked too.
+Reports the time per strip of both.
+
+Run from the server folder:
+    python -m benchmarks.check_extent --cases 20
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import skimage.io
+from skimage import filters
+
+from benchmarks import corpus
+from ocr.engine.image2string import EXPAND_PIXEL_NUMBER, LARGE_NUMBER, SMALL_NUMBER, _get_extent, _remove_bbox
+
+COLOR_BLACK = 0
+COLOR_WHITE = 255
+
+
+def reference_extents(img_mask):
+    """The former double loop of image_filter, returns the black and the white (min_x, min_y, max_x, max_y, count)."""
+    black_min_x = LARGE_NUMBER
+    black_min_y = LARGE_NUMBER
+    black_max_x = SMALL_NUMBER
+    black_max_y = SMALL_NUMBER
+    black_count = 0
+
+    white_min_x = LARGE_NUMBER
+    white_min_y = LARGE_NUMBER
+    white_max_x = SMALL_NUMBER
+    white_max_y = SMALL_NUMBER
+    white_count = 0
+
+    for x in range(0, img_mask.shape[1]):
+        for y in range(0, img_mask.shape[0]):
+            if img_mask[y][x] == COLOR_BLACK:
+                black_min_x = min(black_min_x, x)
+                black_min_y = min(black_min_y, y)
+                black_max_x = max(black_max_x, x)
+                black_max_y = max(black_max_y, y)
+                black_count += 1
+            elif img_mask[y][x] == COLOR_WHITE:
+                white_min_x = min(white_min_x, x)
+                white_min_y = min(white_min_y, y)
+                white_max_x = max(white_max_x, x)
+                white_max_y = max(white_max_y, y)
+                white_count += 1
+    return ((black_min_x, black_min_y, black_max_x, black_max_y, black_count),
+            (white_min_x, white_min_y, white_max_x, white_max_y, white_count))
+
+
+def vectorized_extents(img_mask):
+    return _get_extent(img_mask == COLOR_BLACK), _get_extent(img_mask == COLOR_WHITE)
+
+
+def crop(extents, shape):
+    """The crop box ((x0, y0), (x1, y1)) and white background decision image_filter derives from the extents."""
+    black, white = extents
+    text = black
+    is_white_background = True
+    if black[4] > white[4]:
+        text = white
+        is_white_background = False
+    height, width = shape
+    start = (max(0, text[0] - EXPAND_PIXEL_NUMBER), max(0, text[1] - EXPAND_PIXEL_NUMBER))
+    end = (min(width, text[2] + 1 + EXPAND_PIXEL_NUMBER), min(height, text[3] + 1 + EXPAND_PIXEL_NUMBER))
+    return start, end, is_white_background
+
+
+def otsu_mask(filename, removeboundingbox):
+    """The mask image_filter computes the extents of."""
+    img = cv2.cvtColor(skimage.io.imread(filename), cv2.COLOR_BGR2GRAY)
+    if removeboundingbox:
+        img = _remove_bbox(img)
+    return ((img > filters.threshold_otsu(img)) * 255).astype('uint8')
+
+
+def check(name, img_mask, timings):
+    start = time.perf_counter()
+    expected = reference_extents(img_mask)
+    middle = time.perf_counter()
+    extents = vectorized_extents(img_mask)
+    timings['reference'] += middle - start
+    timings['vectorized'] += time.perf_counter() - middle
+    assert extents == expected, '{}: extents {} differ from {}'.format(name, extents, expected)
+    assert crop(extents, img_mask.shape) == crop(expected, img_mask.shape), '{}: crop differs'.format(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check _get_extent against the former per-pixel loop')
+    parser.add_argument('--corpus', help='corpus folder, a temporary one is rendered if not given')
+    parser.add_argument('--cases', type=int, default=20, help='patient IDs of a rendered corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        manifest = corpus.load(corpus_dir) if args.corpus else corpus.generate(tmp, args.cases, seed=args.seed)
+        timings = {'reference': 0.0, 'vectorized': 0.0}
+        masks = 0
+        for case in manifest:
+            for name in [case['setup']] + case['apply']:
+                for removeboundingbox in (True, False):
+                    check(name, otsu_mask(os.path.join(corpus_dir, name), removeboundingbox), timings)
+                    masks += 1
+    for value in (COLOR_BLACK, COLOR_WHITE, 128):
+        check('blank {}'.format(value), np.full((40, 200), value, dtype=np.uint8), timings)
+    report = {
+        'masks': masks,
+        'identical': True,
+        'reference_ms_per_mask': timings['reference'] / masks * 1000,
+        'vectorized_ms_per_mask': timings['vectorized'] / masks * 1000,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# -*- coding=utf-8 -*-
+"""Synthetic patient-ID strip corpus with ground truth.
+
+Every case is one patient ID rendered in one style: a setup strip for SigmaOCR.ocr_setup and a few apply
+strips, captured with small variations, for ocr_apply. Styles cover fonts, sizes, dark and light backgrounds,
+"ID:" and ":" prefixes, solid and dashed bounding boxes, salt-and-pepper noise and JPEG artifacts.
+
+Run from the server folder:
+    python -m benchmarks.corpus --output /tmp/ocr-corpus
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import random
+
+import cv2
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+
+HERSHEY_FONTS = {
+    'simplex': cv2.FONT_HERSHEY_SIMPLEX,
+    'duplex': cv2.FONT_HERSHEY_DUPLEX,
+    'complex': cv2.FONT_HERSHEY_COMPLEX,
+    'triplex': cv2.FONT_HERSHEY_TRIPLEX,
+}
+PREFIXES = ('', ':', 'ID:')
+BOXES = ('none', 'solid', 'dashed')
+MANIFEST = 'manifest.json'
+
+
+def random_style(rng, ttf_fonts=()):
+    """Draw the rendering style of one case."""
+    fonts = list(HERSHEY_FONTS) + list(ttf_fonts)
+    dark = rng.random() < 0.4
+    level = rng.randint(0, 50) if dark else rng.randint(200, 255)
+    return {
+        'font': rng.choice(fonts),
+        'height': rng.randint(28, 64),
+        'dark': dark,
+        'background': level,
+        'foreground': 255 - level,
+        'prefix': rng.choice(PREFIXES),
+        'box': rng.choice(BOXES),
+        'noise': rng.choice((0.0, 0.0, 0.005, 0.02)),
+        'jpeg': rng.choice((None, None, 90, 75)),
+    }
+
+
+def _draw_text(img, text, style, x, y):
+    font = style['font']
+    color = (style['foreground'],) * 3
+    if font in HERSHEY_FONTS:
+        scale = style['height'] / 45.0
+        thickness = max(1, style['height'] // 24)
+        cv2.putText(img, text, (x, y), HERSHEY_FONTS[font], scale, color, thickness, cv2.LINE_AA)
+        return img
+    pil = PIL.Image.fromarray(img)
+    size = int(style['height'] * 0.6)
+    PIL.ImageDraw.Draw(pil).text((x, y - size), text, font=PIL.ImageFont.truetype(font, size), fill=color)
+    return np.array(pil)
+
+
+def _draw_box(img, style):
+    h, w = img.shape[:2]
+    color = (style['foreground'],) * 3
+    if style['box'] == 'solid':
+        cv2.rectangle(img, (0, 0), (w - 1, h - 1), color, 1)
+    elif style['box'] == 'dashed':
+        for x in range(0, w, 6):
+            cv2.line(img, (x, 0), (x + 2, 0), color, 1)
+            cv2.line(img, (x, h - 1), (x + 2, h - 1), color, 1)
+        for y in range(0, h, 6):
+            cv2.line(img, (0, y), (0, y + 2), color, 1)
+            cv2.line(img, (w - 1, y), (w - 1, y + 2), color, 1)
+
+
+def render_strip(text, style, rng):
+    """Render one BGR strip of `text`, the strip position and size vary slightly between captures."""
+    label = style['prefix'] + text
+    h = style['height'] + rng.randint(0, 4)
+    w = int(len(label) * style['height'] * 0.62) + rng.randint(20, 40)
+    img = np.full((h, w, 3), style['background'], dtype=np.uint8)
+    img = _draw_text(img, label, style, rng.randint(10, 16), h - max(4, h // 5))
+    _draw_box(img, style)
+    if style['noise']:
+        mask = np.random.RandomState(rng.randint(0, 2 ** 31)).rand(h, w) < style['noise']
+        img[mask] = style['foreground']
+    if style['jpeg']:
+        img = cv2.imdecode(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, style['jpeg']])[1], cv2.IMREAD_COLOR)
+    return img
+
+
+def generate(output, cases=20, strips=4, seed=0, ttf_fonts=()):
+    """Write the corpus images and manifest.json to output, returns the manifest.
+
+    Each manifest entry has the ground truth 'text', the 'style', the 'setup' file and the 'apply' files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output, exist_ok=True)
+    manifest = []
+    for case in range(cases):
+        text = ''.join(rng.choice('0123456789') for _ in range(rng.randint(6, 12)))
+        style = random_style(rng, ttf_fonts)
+        files = []
+        for i in range(strips + 1):
+            name = 'case{:04d}_{}.png'.format(case, i)
+            cv2.imwrite(os.path.join(output, name), render_strip(text, style, rng))
+            files.append(name)
+        manifest.append({'case': case, 'text': text, 'style': style, 'setup': files[0], 'apply': files[1:]})
+    with open(os.path.join(output, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load(corpus_dir):
+    with open(os.path.join(corpus_dir, MANIFEST), 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic patient-ID strip corpus')
+    parser.add_argument('--output', required=True, help='corpus folder')
+    parser.add_argument('--cases', type=int, default=20, help='patient IDs')
+    parser.add_argument('--strips', type=int, default=4, help='apply strips per patient ID')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--font', action='append', default=[], help='TrueType font file, repeatable')
+    args = parser.parse_args()
+    manifest = generate(args.output, args.cases, args.strips, args.seed, args.font)
+    print('Generated {} cases in {}'.format(len(manifest), args.output))
+
+
+if __name__ == '__main__':
+    main()
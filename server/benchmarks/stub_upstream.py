@@ -0,0 +1,168 @@
+# -*- coding=utf-8 -*-
+"""Local stand-in for the sigma server and cloud endpoints used by ServerRequest and CloudRequest.
+
+Answers the jobs and downloads calls with generated data, after an optional latency, and fails a share of
+them with 503 to exercise the retries. Counts the connections it accepts and the calls it answers.
+
+Run from the server folder:
+    python -m benchmarks.stub_upstream --port 7070 --latency 0.01
+"""
+from __future__ import absolute_import
+
+import argparse
+import functools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+SERVER_JOBS = re.compile(r'^/jobs$')
+SERVER_DOWNLOADS = re.compile(r'^/data/downloads/(?P<id>[^/]+)$')
+CLOUD_JOBS = re.compile(r'^/accounts/(?P<account>[^/]+)/jobs/(?P<id>[^/]+)/$')
+CLOUD_DOWNLOADS = re.compile(r'^/accounts/(?P<account>[^/]+)/store/downloads/$')
+
+
+def result_json(unique_id, padding=0, contour=0):
+    """The result json of a series, its lesion count derived from the id.
+
+    Every lesion has a contour of `contour` points, listed before the count as the scanner's worst case.
+    """
+    count = sum(bytearray(unique_id.encode())) % 7
+    lesions = [{'id': i, 'contour': [[i + j % 512, j // 512] for j in range(contour)]} for i in range(count)]
+    content = {field: {'lesions': lesions, 'count': count}
+               for field in ('Nodules', 'Diseases', 'MammoDisease', 'ICHDisease', 'lesion')}
+    content['padding'] = 'x' * padding
+    return content
+
+
+@functools.lru_cache(maxsize=16)
+def result_body(unique_id, padding=0, contour=0):
+    """The encoded result json, cached as large ones take long to generate."""
+    return json.dumps(result_json(unique_id, padding, contour)).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out as separate writes, without this a keep-alive client waits on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self, code, content):
+        body = content if isinstance(content, bytes) else json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        self.server.count('requests')
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self.headers.get('Authorization', '').startswith('12Sigma '):
+            return self._answer(401, {'error': 'unsigned request'})
+        if self.server.fail_rate and self.server.random() < self.server.fail_rate:
+            self.server.count('failures')
+            return self._answer(503, {'error': 'injected failure'})
+
+        parsed = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        match = CLOUD_JOBS.match(parsed.path)
+        if match and method == 'PATCH':
+            return self._answer(200, {'data': {'job_id': match.group('id')}})
+        if match:
+            return self._answer(200, {'data': {'job_id': match.group('id'), 'status': 'waiting',
+                                               'queue': {'location': 2}}})
+        if method != 'GET':
+            return self._answer(405, {'error': 'method not allowed'})
+        if SERVER_JOBS.match(parsed.path):
+            return self._answer(200, [{'unique_id': query.get('unique_id'), 'status': 'completed'}])
+        match = SERVER_DOWNLOADS.match(parsed.path)
+        if match:
+            return self._answer(200, result_body(match.group('id'), self.server.padding, self.server.contour))
+        if CLOUD_DOWNLOADS.match(parsed.path) and query.get('filename', '').endswith('.json'):
+            if 'download_id' not in query:
+                return self._answer(200, {'download_id': 'd' + query['filename']})
+            return self._answer(200, result_body(query['filename'][:-len('.json')], self.server.padding,
+                                            self.server.contour))
+        return self._answer(404, {'error': 'not found'})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_PATCH(self):
+        self._route('PATCH')
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """Threaded stub, `stats` holds the accepted connections, answered calls and injected failures."""
+
+    daemon_threads = True
+    # concurrent clients open many connections at once, the default backlog of 5 drops some of them
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.0, fail_rate=0.0, padding=0, seed=0, contour=0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.padding = padding
+        self.contour = contour
+        self.stats = {'connections': 0, 'requests': 0, 'failures': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def handle_error(self, request, client_address):
+        # a client reading only the start of a result json closes its connection early
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def start(self):
+        """Serve on a daemon thread, returns self."""
+        threading.Thread(target=self.serve_forever, name='stub-upstream', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve stand-in sigma server and cloud endpoints')
+    parser.add_argument('--port', type=int, default=7070)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every answer')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of calls answered with 503')
+    parser.add_argument('--padding', type=int, default=0, help='extra bytes in every result json')
+    parser.add_argument('--contour', type=int, default=0, help='contour points of every lesion')
+    args = parser.parse_args()
+    server = StubServer(args.port, args.latency, args.fail_rate, args.padding, contour=args.contour)
+    print('Serving on {}'.format(server.endpoint))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
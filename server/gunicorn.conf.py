@@ -0,0 +1,17 @@
+# -*- coding=utf-8 -*-
+"""Gunicorn settings of the production server.
+
+Run with `gunicorn -c gunicorn.conf.py autoserv:app`, reload gracefully with `kill -HUP <master pid>`.
+"""
+from ocr.sigma import conf
+
+# same port as autoserv.HTTP_PORT_SERVICE
+bind = '0.0.0.0:7002'
+workers = conf.get_serving_workers()
+threads = conf.get_serving_threads()
+timeout = conf.get_serving_timeout()
+graceful_timeout = timeout
+# the app is imported by every worker after the fork, the engine is created there on first use
+preload_app = False
+pidfile = '/tmp/sigmaocr-gunicorn.pid'
+accesslog = '-'
@@ -0,0 +1,54 @@
+# -*- coding=utf-8 -*-
+"""Thread-safe LRU cache with optional time-to-live, shared by the OCR engine and the queries."""
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Keep at most `maxsize` entries, drop the least recently used first and entries older than `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a value and mark it as recently used, count the hit or miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        """Insert or refresh a value, evicting the least recently used entries beyond maxsize."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Get the hit/miss counters and the size of the cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data),
+                    'maxsize': self.maxsize, 'ttl': self.ttl}
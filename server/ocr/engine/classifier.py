@@ -0,0 +1,217 @@
+"""
+HOG feature extraction and SVM classification of the cropped ID strips.
+
+All images of a request are classified as one batch: features go into one preallocated (N, feature_dim)
+matrix and the model runs once per batch.
+
+The model is loaded on first use by a ModelRegistry. When `svm.npz` (see `export_model`) sits next to
+`svm.sav` it is preferred, and the decision function runs in pure NumPy without importing scikit-learn.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from ocr import metrics
+
+_logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+MODEL_DIR = os.path.dirname(__file__)
+PICKLE_MODEL = 'svm.sav'
+NUMPY_MODEL = 'svm.npz'
+
+
+def get_descriptor():
+    """Get the HOG descriptor of the calling thread, created once per worker thread."""
+    hog = getattr(_local, 'hog', None)
+    if hog is None:
+        hog = _local.hog = cv2.HOGDescriptor()
+    return hog
+
+
+def compute_hogs(img_list):
+    """Compute the HOG features of equally sized images.
+
+    Args:
+        img_list: list of ndarray images, all with the same shape
+
+    Returns:
+        float32 ndarray of shape (len(img_list), feature_dim)
+    """
+    hog = get_descriptor()
+    features = None
+    for i, roi in enumerate(img_list):
+        descriptor = hog.compute(roi)
+        if features is None:
+            features = np.empty((len(img_list), descriptor.size), dtype=np.float32)
+        features[i] = descriptor.ravel()
+    return features
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class NumpySVC:
+    """Decision function of a binary scikit-learn SVC evaluated with NumPy only."""
+
+    KERNELS = ('linear', 'poly', 'rbf', 'sigmoid')
+
+    def __init__(self, support_vectors, dual_coef, intercept, classes, kernel, gamma, coef0, degree):
+        if kernel not in self.KERNELS:
+            raise ValueError('Unsupported SVM kernel: {}'.format(kernel))
+        self.support_vectors = support_vectors
+        self.dual_coef = dual_coef
+        self.intercept = intercept
+        self.classes = classes
+        self.kernel = kernel
+        self.gamma = gamma
+        self.coef0 = coef0
+        self.degree = degree
+        self._sv_norms = (support_vectors ** 2).sum(axis=1)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['support_vectors'], data['dual_coef'], data['intercept'], data['classes'],
+                       str(data['kernel']), float(data['gamma']), float(data['coef0']), int(data['degree']))
+
+    def _kernel(self, features):
+        dot = np.dot(features, self.support_vectors.T)
+        if self.kernel == 'linear':
+            return dot
+        if self.kernel == 'poly':
+            return (self.gamma * dot + self.coef0) ** self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * dot + self.coef0)
+        distances = (features ** 2).sum(axis=1)[:, np.newaxis] + self._sv_norms - 2 * dot
+        return np.exp(-self.gamma * np.maximum(distances, 0))
+
+    def decision_function(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        return np.dot(self._kernel(features), self.dual_coef[0]) + self.intercept[0]
+
+    def predict(self, features):
+        return self.classes[(self.decision_function(features) > 0).astype(int)]
+
+
+def export_model(model, path, version=None):
+    """Export a binary scikit-learn SVC to a compressed npz file readable by NumpySVC."""
+    if len(model.classes_) != 2:
+        raise ValueError('Only binary SVM models can be exported')
+    kernel = model.kernel if isinstance(model.kernel, str) else ''
+    if kernel not in NumpySVC.KERNELS:
+        raise ValueError('Unsupported SVM kernel: {}'.format(model.kernel))
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, support_vectors=model.support_vectors_.astype(np.float64),
+                            dual_coef=model.dual_coef_.astype(np.float64), intercept=model.intercept_.astype(np.float64),
+                            classes=model.classes_, kernel=kernel, gamma=model._gamma, coef0=model.coef0,
+                            degree=model.degree, version=version or '')
+
+
+class ModelRegistry:
+    """Load the SVM model lazily, once, and record where it comes from.
+
+    The version of a model is the hash of the pickle it was trained into, an exported npz keeps the version
+    of its source pickle.
+    """
+
+    def __init__(self, directory=MODEL_DIR):
+        self.directory = directory
+        self._model = None
+        self._info = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        start = time.perf_counter()
+        path = os.path.join(self.directory, NUMPY_MODEL)
+        if os.path.isfile(path):
+            model = NumpySVC.load(path)
+            with np.load(path) as data:
+                version = str(data['version'])
+            fmt = 'numpy'
+        else:
+            path = os.path.join(self.directory, PICKLE_MODEL)
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+            version = ''
+            fmt = 'pickle'
+        sha1 = _file_hash(path)
+        self._info = {'path': path, 'format': fmt, 'sha1': sha1, 'version': version or sha1[:12],
+                      'load_seconds': time.perf_counter() - start}
+        _logger.info('Classifier model loaded: {}'.format(self._info))
+        return model
+
+    def get(self):
+        """Get the model, loading it on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def set(self, model, **info):
+        """Replace the model, e.g. with one trained in-process."""
+        with self._lock:
+            self._model = model
+            self._info = info
+
+    def info(self):
+        """Get the path, format, hash, version and load time of the model, empty before it is loaded."""
+        return dict(self._info)
+
+
+class HOGClassifier:
+    """Classify images as valid ID strips from their HOG features."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or ModelRegistry()
+
+    @property
+    def model(self):
+        return self.registry.get()
+
+    def classify(self, img_list, scores=False):
+        """Classify a batch of images.
+
+        Args:
+            img_list: list of equally sized ndarray images
+            scores (Optional): also compute the decision scores, higher is more confident
+
+        Returns:
+            Tuple of (labels, decision scores or None)
+        """
+        model = self.model
+        with metrics.stage('hog'):
+            features = compute_hogs(img_list)
+        with metrics.stage('svm'):
+            labels = model.predict(features)
+            return labels, model.decision_function(features) if scores else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the pickled SVM model to {}'.format(NUMPY_MODEL))
+    parser.add_argument('--directory', default=MODEL_DIR, help='directory of {}'.format(PICKLE_MODEL))
+    args = parser.parse_args()
+    source = os.path.join(args.directory, PICKLE_MODEL)
+    with open(source, 'rb') as f:
+        model = pickle.load(f)
+    target = os.path.join(args.directory, NUMPY_MODEL)
+    export_model(model, target, version=_file_hash(source)[:12])
+    print('Exported {} to {}'.format(source, target))
+
+
+if __name__ == '__main__':
+    main()
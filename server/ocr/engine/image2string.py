@@ -9,17 +9,17 @@ Required libraries:
 """
 
 
-import subprocess
 import os
 import numpy
 import warnings
 import skimage
-import PIL
+import PIL.Image
 import cv2
 from skimage import io
 from skimage import filters
 
-import pytesseract
+from ocr.engine.rle import get_block_heights, get_border_lines, get_intervals
+from ocr.engine.tesseract import create_engine
 
 # For debug purposes only
 DEBUG_OUTPUT_TMP_IMG_FLAG = False
@@ -39,13 +39,33 @@ PAD_WIDTH_RATIO = 0.1
 PAD_HEIGHT_RATIO = 0.3
 REMOVE_BORDER_LINE_RATIO = 0.6
 
+# tesseract backend shared by the public functions, see set_default_engine()
+_DEFAULT_ENGINE = None
 
 
 
 # -------------------------- PUBLIC FUNCTIONS ---------------------------------
 
 
-def imagefile_to_digit_string(filename, whitelistchars="0123456789", removeboundingbox=True):
+def get_default_engine():
+    """Returns the tesseract backend used when no engine is given, a subprocess backend unless configured."""
+    global _DEFAULT_ENGINE
+    if _DEFAULT_ENGINE is None:
+        _DEFAULT_ENGINE = create_engine()
+    return _DEFAULT_ENGINE
+
+
+def set_default_engine(engine):
+    """Sets the tesseract backend used when no engine is given.
+
+    Args:
+        engine: Tesseract backend created by ocr.engine.tesseract.create_engine
+    """
+    global _DEFAULT_ENGINE
+    _DEFAULT_ENGINE = engine
+
+
+def imagefile_to_digit_string(filename, whitelistchars="0123456789", removeboundingbox=True, engine=None):
     """Converts an image file that contains digits to a string.
 
     Args:
@@ -56,14 +76,40 @@ def imagefile_to_digit_string(filename, whitelistchars="0123456789", removebound
                                    but having too many characters here can drop the accuracy.
         removeboundingbox (Optional): If True, it will automatically detect and remove bounding boxes from the image.
                                       If accuracy is very low, try switching this to false.
+        engine (Optional): Tesseract backend from ocr.engine.tesseract. The module default engine is used if None.
 
     Returns:
         String of digits converted from the image file.
     """
     skimg = skimage.io.imread(filename) # Read image file as skimage
-    return skimage_to_digit_string(skimg, whitelistchars, removeboundingbox, filename)
+    return skimage_to_digit_string(skimg, whitelistchars, removeboundingbox, filename, engine)
+
+def imagebuffer_to_digit_string(buf, whitelistchars="0123456789", removeboundingbox=True, engine=None):
+    """Converts an encoded image (PNG or JPG bytes) that contains digits to a string, without touching disk.
+
+    Args:
+        buf: Bytes of the encoded image, e.g. an uploaded file
+        whitelistchars (Optional): String of letters to be recognized by the OCR
+        removeboundingbox (Optional): If True, it will automatically detect and remove bounding boxes from the image.
+        engine (Optional): Tesseract backend from ocr.engine.tesseract. The module default engine is used if None.
 
-def PILimage_to_digit_string(img, whitelistchars="0123456789", removeboundingbox=True):
+    Returns:
+        String of digits converted from the image.
+
+    Raises:
+        ValueError: If the bytes are not an image OpenCV can decode.
+    """
+    data = numpy.frombuffer(buf, numpy.uint8)
+    # imdecode asserts on empty data and returns None on bytes it cannot decode
+    skimg = cv2.imdecode(data, cv2.IMREAD_UNCHANGED) if data.size else None
+    if skimg is None:
+        raise ValueError('cannot decode image')
+    if skimg.ndim == 3:
+        # same channel order as skimage.io.imread
+        skimg = cv2.cvtColor(skimg, cv2.COLOR_BGR2RGB if skimg.shape[2] == 3 else cv2.COLOR_BGRA2RGBA)
+    return skimage_to_digit_string(skimg, whitelistchars, removeboundingbox, engine=engine)
+
+def PILimage_to_digit_string(img, whitelistchars="0123456789", removeboundingbox=True, engine=None):
     """Converts a PIL image that contains digits to a string.
 
     Args:
@@ -74,14 +120,15 @@ def PILimage_to_digit_string(img, whitelistchars="0123456789", removeboundingbox
                                    but having too many characters here can drop the accuracy.
         removeboundingbox (Optional): If True, it will automatically detect and remove bounding boxes from the image.
                                       If accuracy is very low, try switching this to false.
+        engine (Optional): Tesseract backend from ocr.engine.tesseract. The module default engine is used if None.
 
     Returns:
         String of digits converted from the image file
     """
     skimg = numpy.array(img) # Convert PIL image to skimage
-    return skimage_to_digit_string(skimg, whitelistchars, removeboundingbox)
+    return skimage_to_digit_string(skimg, whitelistchars, removeboundingbox, engine=engine)
 
-def skimage_to_digit_string(skimg, whitelistchars="0123456789", removeboundingbox=True, filename=None):
+def skimage_to_digit_string(skimg, whitelistchars="0123456789", removeboundingbox=True, filename=None, engine=None):
     """Converts an image that contains digits to a string.
 
     Args:
@@ -92,6 +139,7 @@ def skimage_to_digit_string(skimg, whitelistchars="0123456789", removeboundingbo
                                    but having too many characters here can drop the accuracy.
         removeboundingbox (Optional): If True, it will automatically detect and remove bounding boxes from the image.
                                       If accuracy is very low, try switching this to false.
+        engine (Optional): Tesseract backend from ocr.engine.tesseract. The module default engine is used if None.
 
     Returns:
         String of digits converted from the image.
@@ -109,29 +157,17 @@ def skimage_to_digit_string(skimg, whitelistchars="0123456789", removeboundingbo
     """
 
 
-    pil_img = PIL.Image.fromarray(skimg.astype('uint8'), 'L') # Convert skimage to PIL
-
-    temp_imagefile = ".".join(filename.strip().split(".")[:-1]) + "_tmp.png"
     if DEBUG_OUTPUT_TMP_IMG_FLAG:
-        temp_imagefile = "tmp.png"
-
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")  # Suppress warning message
-
-        pil_img.save(temp_imagefile, dpi=(300, 300))
-
-    result_file_path = ".".join(filename.strip().split(".")[:-1]) + "_result"
-    cmd = "tesseract " + temp_imagefile + " " + result_file_path + " -c tessedit_char_whitelist=" + whitelistchars + " --psm 6 --oem 0"
-    p = subprocess.Popen(cmd, shell=True)
-    p.wait()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # Suppress warning message
+            PIL.Image.fromarray(skimg.astype('uint8'), 'L').save("tmp.png", dpi=(300, 300))
 
-    readfile = open(result_file_path + ".txt", 'r')
-    text = readfile.readline().strip().replace(" ", "").replace("\n", "") # Convert image to digit string
-    readfile.close()
-    answer = text
+    if engine is None:
+        engine = get_default_engine()
+    answer = engine.recognize(skimg, whitelistchars)  # Convert image to digit string
 
     # Post processing to handle suspicious recognitions
-    answer = _post_process(skimg, answer, whitelistchars, temp_imagefile, result_file_path)
+    answer = _post_process(skimg, answer, whitelistchars, engine)
 
 
     return answer
@@ -171,34 +207,9 @@ def image_filter(img, removeboundingbox=True):
 
     # Crop the image so only digits are present in the image
     # Find the top left and bottom right corners of the digits, assuming letters are always black
-    black_min_x = LARGE_NUMBER  # very large number
-    black_min_y = LARGE_NUMBER
-    black_max_x = SMALL_NUMBER
-    black_max_y = SMALL_NUMBER
-    black_count = 0
-
-    white_min_x = LARGE_NUMBER  # very large number
-    white_min_y = LARGE_NUMBER
-    white_max_x = SMALL_NUMBER
-    white_max_y = SMALL_NUMBER
-    white_count = 0
-
-    # enumerate over the pixels and get the region with ID
     # count the numbers of dark and light pixels to determine whether the background is dark or light
-    for x in range(0, img_mask.shape[1]):
-        for y in range(0, img_mask.shape[0]):
-            if img_mask[y][x] == COLOR_BLACK:  # This pixel is black
-                black_min_x = min(black_min_x, x)
-                black_min_y = min(black_min_y, y)
-                black_max_x = max(black_max_x, x)
-                black_max_y = max(black_max_y, y)
-                black_count += 1
-            elif img_mask[y][x] == COLOR_WHITE:  # This pixel is white
-                white_min_x = min(white_min_x, x)
-                white_min_y = min(white_min_y, y)
-                white_max_x = max(white_max_x, x)
-                white_max_y = max(white_max_y, y)
-                white_count += 1
+    black_min_x, black_min_y, black_max_x, black_max_y, black_count = _get_extent(img_mask == COLOR_BLACK)
+    white_min_x, white_min_y, white_max_x, white_max_y, white_count = _get_extent(img_mask == COLOR_WHITE)
 
     isWhiteBackground = True
     textStartLoc = (black_min_x, black_min_y)
@@ -240,23 +251,10 @@ def image_filter(img, removeboundingbox=True):
 
     # Remove leading colon
     backgroundcolor = _get_background_color(img)
-    intervals = _get_interval(img_mask)  # get the column intervals between characters
+    intervals = get_intervals(img_mask)  # get the column intervals between characters
     word_blocks = list(_get_complement(intervals, 0, width-1))  # the word blocks are the complement of the intervals
-    height_list = []
-
-    # For each word block, get the height of the character and put it into height_list
-    for block in word_blocks:
-        start_index = 0
-        end_index = newheight-1
-        for i in range(newheight):
-            if img_mask[i, block[0]:block[1]].all() != (255*numpy.ones(block[1]-block[0])).all():
-                start_index = i
-                break
-        for i in range(newheight-1, -1, -1):
-            if img_mask[i, block[0]:block[1]].all() != (255*numpy.ones(block[1]-block[0])).all():
-                end_index = i
-                break
-        height_list.append((end_index-start_index+1))
+    # For each word block, get the height of the character
+    height_list = get_block_heights(img_mask, word_blocks)
 
     # threshold is the median of the height_list
     threshold = numpy.percentile(numpy.array(height_list), 50)
@@ -293,36 +291,17 @@ def image_filter(img, removeboundingbox=True):
 
 # -------------------------- INTERNAL FUNCTIONS ---------------------------------
 
-def _get_interval(img):
+def _get_extent(mask):
     """(Internal function, Do not call from outside)
-    Get intervals between characters
-    :param img: binary image
-    :return: a list of tuples represents a list of intervals
+    Get the bounding box of the true pixels of a mask
+    :param mask: 2-D boolean image
+    :return: (min_x, min_y, max_x, max_y, count), coordinates are LARGE_NUMBER/SMALL_NUMBER if the mask is empty
     """
-    rotated = img.transpose(1, 0)
-    height, width = rotated.shape
-    bgRow = numpy.array([255]*width)
-    flag = False
-    start = -1
-    lst = []
-    for i in range(height):
-        if (abs(bgRow-rotated[i])).sum() < 255:
-            if not flag:
-                flag = True
-                start = i
-                end = start
-            else:
-                end = max(start, i)
-        else:
-            flag = False
-            if start >= 0:
-                lst.append((start, end))
-                start = -1
-
-    if flag == True:
-        lst.append((start, end))
-
-    return lst
+    xs = numpy.flatnonzero(mask.any(axis=0))
+    if not xs.size:
+        return LARGE_NUMBER, LARGE_NUMBER, SMALL_NUMBER, SMALL_NUMBER, 0
+    ys = numpy.flatnonzero(mask.any(axis=1))
+    return int(xs[0]), int(ys[0]), int(xs[-1]), int(ys[-1]), int(numpy.count_nonzero(mask))
 
 def _get_complement(intervals, mn, mx):
     """(Internal function, Do not call from outside)
@@ -343,7 +322,7 @@ def _get_complement(intervals, mn, mx):
     if next_start < mx:
         yield next_start, mx
 
-def _post_process(skimg_preprocess, answer, whitelistchars, input_img_file_path, result_file_path):
+def _post_process(skimg_preprocess, answer, whitelistchars, engine):
     """(Internal function, Do not call from outside)
     After digit recognition, if there are some skeptical letters (such as 'Z' vs '2'), this function will handle those cases
 
@@ -351,15 +330,14 @@ def _post_process(skimg_preprocess, answer, whitelistchars, input_img_file_path,
         skimg_preprocess: Sitk image after pre-processing
         answer: Answer string that tesseract returned
         whitelistchars: White list characters
-        input_img_file_path: Path to the pre-processed image file
-        result_file_path: Path to the output result file
+        engine: Tesseract backend that recognized the answer
 
     Returns:
         Corrected answer string
     """
     bbox_dict = None
 
-    answer, bbox_dict = _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, input_img_file_path, result_file_path)
+    answer, bbox_dict = _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, engine)
 
     return answer
 
@@ -411,45 +389,29 @@ def _get_index(img, bg_color, mode):
         index: a list of indices that contains a line that has a different with background, length is longer than a ratio and the line touches the border of the image
         row: a list of lists, each element is a four elements list that represents a row(column) that contains a line longer than a ratio [index, start, end, color]
     """
-    h, w = img.shape
-    index = []
-    row = []
-    for i in range(h):
-        bits = img[i]
-        n = bits.shape[0]
-        loc_run_start = numpy.empty(n, dtype=bool)
-        loc_run_start[0] = True
-        numpy.not_equal(bits[:-1], bits[1:], out=loc_run_start[1:])
-        run_starts = numpy.nonzero(loc_run_start)[0]  # start of consecutive values
-        run_values = bits[loc_run_start]  # consecutive value, which is the color of pixels
-        run_lengths = numpy.diff(numpy.append(run_starts, n))  # length of consecutive value
-
-        # remove dashed line borders
-        for j in range(len(run_lengths) - 1):
-            len_element = [run_lengths[j], run_lengths[j + 1]]  # repeating length pattern element
-            val_element = [run_values[j], run_values[j + 1]]  # repeating pixel color pattern element
-            total_length = numpy.sum(run_lengths)
-            times = int(total_length * REMOVE_BORDER_LINE_RATIO) // (len_element[0] + len_element[1])  # repeating times threshold
-            len_repeat = numpy.tile(len_element, times)
-            val_repeat = numpy.tile(val_element, times)
-            if times >= 3 and j + times * 2 <= len(run_lengths) and \
-                    numpy.array_equal(len_repeat, run_lengths[j:j + times * 2]) and \
-                    numpy.array_equal(val_repeat, run_values[j:j + times * 2]):
-                index.append(i)
-                break
-
-        for j in range(len(run_starts)):
-            if run_values[j] != bg_color and run_lengths[j] > int(w*REMOVE_BORDER_LINE_RATIO):
-                if mode == "row":
-                    row.append([i, run_starts[j], run_starts[j]+run_lengths[j], run_values[j]])
-                elif mode == "col":
-                    row.append([i, run_starts[j], run_starts[j]+run_lengths[j], run_values[j]])
-
-            if run_values[j] != bg_color and run_lengths[j] > int(w*REMOVE_BORDER_LINE_RATIO) and \
-                    (run_starts[j] == 0 or run_starts[j]+run_lengths[j]==w):
-                index.append(i)
-
-    return index, row
+    return get_border_lines(img, bg_color, REMOVE_BORDER_LINE_RATIO)
+
+
+def _get_border_columns(maskImg):
+    """(Internal function, Do not call from outside)
+    Finds the columns of maskImg that are border lines, or cross a horizontal border line of a similar color
+
+    Args:
+        maskImg: grayscale or binary image
+
+    Returns:
+        a sorted list of column indices
+    """
+    mask_bg_color = _get_background_color(maskImg)
+    rowIndex, rows = _get_index(maskImg, mask_bg_color, "row")
+    colIndex, cols = _get_index(maskImg.transpose(1,0), mask_bg_color, "col")
+    if rows and cols:
+        rows = numpy.array(rows)
+        cols = numpy.array(cols)
+        position = cols[:, 0:1]
+        crossed = (rows[:, 1] <= position) & (position <= rows[:, 2]) & (numpy.abs(cols[:, 3:4] - rows[:, 3]) < 3)
+        colIndex.extend(cols[crossed.any(axis=1), 0].tolist())
+    return sorted(set(colIndex))
 
 
 def _remove_bbox_part(maskImg, img):
@@ -463,22 +425,8 @@ def _remove_bbox_part(maskImg, img):
     Returns:
         img: which has borders removed
     """
-    mask_bg_color = _get_background_color(maskImg)
-    rowIndex, rows = _get_index(maskImg, mask_bg_color, "row")
-    colIndex, cols = _get_index(maskImg.transpose(1,0), mask_bg_color, "col")
-    for row in rows:
-        for col in cols:
-            if row[1] <= col[0] <= row[2] and abs(int(col[3])-int(row[3]))<3:
-                # rowIndex.append(row[0])
-                colIndex.append(col[0])
-    colIndex = list(set(colIndex))
-    # rowIndex = list(set(rowIndex))
-
-    bg_color = _get_background_color(img)
-    for i in colIndex:
-        img[:,i] = bg_color
-    #for i in rowIndex:
-    #    img[i,:] = bg_color
+    colIndex = _get_border_columns(maskImg)
+    img[:, colIndex] = _get_background_color(img)
 
     return img
 
@@ -504,7 +452,7 @@ def _remove_bbox(img):
 
 
 
-def _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, input_img_file_path, result_file_path):
+def _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, engine):
     """(Internal function, Do not call from outside)
     2 and Z are not distinguished correctly in tesseract, so we manually look into this case.
 
@@ -514,8 +462,7 @@ def _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, inp
         whitelistchars: White list characters
         bbox_dict: Bounding box dictionary for each letter if other post-processing function already generated this.
                    If not, specify None
-        input_img_file_path: Path to the preprocessed image file
-        result_file_path: Path to the output file
+        engine: Tesseract backend used to locate the letters
 
     Returns:
         Tuple of (corrected_answer, bbox_dict)
@@ -529,10 +476,7 @@ def _post_process_2andZ(skimg_preprocess, answer, whitelistchars, bbox_dict, inp
         return answer, bbox_dict
 
     if bbox_dict is None:
-        pass
-        pytesseract_config = "-c tessedit_char_whitelist=" + whitelistchars + " --psm 6 --oem 0"
-        bbox_dict = pytesseract.image_to_boxes(skimg_preprocess, config=pytesseract_config, output_type=pytesseract.Output.DICT)
-        #corrected_answer = pytesseract.image_to_string(skimg_preprocess, config=pytesseract_config)
+        bbox_dict = engine.boxes(skimg_preprocess, whitelistchars)
 
     char_list = bbox_dict["char"]
     if len(char_list) == 0:
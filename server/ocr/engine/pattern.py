@@ -1,6 +1,5 @@
 from operator import itemgetter
-import queue
-import copy
+import itertools
 import re
 
 class IllegalPatternError(Exception):
@@ -43,6 +42,7 @@ class ConvertStrToPatternList:
     """
     def __init__(self, pattern_str):
         self.pattern_str = pattern_str
+        self.component_list = []
         self.pattern_list = []
 
     def _str_parser(self):
@@ -135,47 +135,25 @@ class ConvertStrToPatternList:
 
 
     def _bfs_pattern(self, component_list):
-        """bfs the component_list and get all the potential patterns
+        """expand the component_list to all the potential patterns, in breadth-first order
         Args:
             component_list: a list of all the components of the pattern
         Returns:
             potential_pattern: a list of all the potential patterns
         """
-        root = component_list[0]
-        pattern_queue = queue.Queue()
-        # insert the first element into the queue
-        for key, value in root.items():
-            if isinstance(value, str):
-                pattern_tmp = pattern()
+        choices = []
+        for block in component_list:
+            for key, value in block.items():
+                choices.append([(key, value)] if isinstance(value, str) else [(key, item) for item in value])
+
+        potential_pattern = []
+        for combination in itertools.product(*choices):
+            pattern_tmp = pattern()
+            for key, value in combination:
                 pattern_tmp.updatePattern(key, value)
-                pattern_queue.put(pattern_tmp)
-            elif isinstance(value, list):
-                for item in value:
-                    pattern_tmp = pattern()
-                    pattern_tmp.updatePattern(key, item)
-                    pattern_queue.put(pattern_tmp)
-
-        # bfs
-        next_queue = queue.Queue()
-        for block in component_list[1:]:
-            while not pattern_queue.empty():
-                front = pattern_queue.get()
-                for key, value in block.items():
-                    if isinstance(value, str):
-                        front.updatePattern(key, value)
-                        next_queue.put(copy.deepcopy(front))
-                        front.pop()
-                    elif isinstance(value, list):
-                        for item in value:
-                            front.updatePattern(key, item)
-                            next_queue.put(copy.deepcopy(front))
-                            front.pop()
-            pattern_queue.queue = copy.deepcopy(next_queue.queue)
-            next_queue = queue.Queue()
-
-        potential_pattern = list(pattern_queue.queue)
-
-        self.pattern_list = potential_pattern
+            potential_pattern.append(pattern_tmp)
+
+        return potential_pattern
 
 
     def process(self):
@@ -183,16 +161,97 @@ class ConvertStrToPatternList:
             ConvertStrToPatternList pipeline
         """
         parsed_pattern_str = self._str_parser()
-        component_list = self._component_converter(parsed_pattern_str)
-        self._bfs_pattern(component_list)
+        self.component_list = self._component_converter(parsed_pattern_str)
+        self.pattern_list = None
 
     def get_pattern_list(self):
         """
-            Get pattern list
+            Get pattern list, expanded on first use since it grows with the product of all length ranges
         """
+        if self.pattern_list is None:
+            self.pattern_list = self._bfs_pattern(self.component_list) if self.component_list else []
         return self.pattern_list
 
+    def get_automaton(self):
+        """
+            Get the pattern compiled for matching, see PatternAutomaton
+        """
+        return PatternAutomaton(self.component_list)
+
+
+class PatternAutomaton:
+    """
+        Pattern compiled to a dynamic program over (component, pid position).
+        Finds the same best conversion as matching every expanded pattern, in O(len(pid) x components x range).
+    """
+    def __init__(self, component_list):
+        self.components = []
+        for block in component_list:
+            for key, value in block.items():
+                self.components.append((key, value))
+
+    def __bool__(self):
+        return bool(self.components)
+
+    def _segments(self, key, value):
+        """lengths a component can take, in the order of the expanded pattern list"""
+        return [len(value)] if key == 'f' else value
+
+    def match(self, pid):
+        """
+            Convert pid to the pattern with the fewest changed characters, ties go to the first expanded pattern
+            Returns: [] if no pattern fits the pid length, else [{'change_bits': ..., 'converted_pid': ...}]
+        """
+        n = len(pid)
+        if not self.components:
+            return []
+        # changes needed to convert pid[:i] to letters / digits, as prefix sums
+        letter_changes = [0]
+        digit_changes = [0]
+        for ch in pid:
+            letter_changes.append(letter_changes[-1] + (PatternMatching._char_to_letter(ch) != ch))
+            digit_changes.append(digit_changes[-1] + (PatternMatching._char_to_digit(ch) != ch))
+
+        def cost(key, value, pos, length):
+            if key == 'f':
+                return sum(1 for a, b in zip(pid[pos:pos+length], value) if a != b)
+            changes = letter_changes if key == 'L' else digit_changes
+            return changes[pos+length] - changes[pos]
+
+        # best[k][pos]: (fewest changes, length of component k) to convert pid[pos:] with components k...
+        k_count = len(self.components)
+        best = [[None] * (n + 1) for _ in range(k_count + 1)]
+        best[k_count][n] = (0, 0)
+        for k in range(k_count - 1, -1, -1):
+            key, value = self.components[k]
+            for pos in range(n + 1):
+                for length in self._segments(key, value):
+                    if pos + length > n or best[k+1][pos+length] is None:
+                        continue
+                    total = cost(key, value, pos, length) + best[k+1][pos+length][0]
+                    # strictly better only, so the earlier length wins ties like in the expansion order
+                    if best[k][pos] is None or total < best[k][pos][0]:
+                        best[k][pos] = (total, length)
+
+        if best[0][0] is None:
+            return []
+        converted_pid = ""
+        pos = 0
+        for k, (key, value) in enumerate(self.components):
+            length = best[k][pos][1]
+            if key == 'f':
+                converted_pid += value
+            elif key == 'L':
+                converted_pid += "".join(PatternMatching._char_to_letter(ch) for ch in pid[pos:pos+length])
+            else:
+                converted_pid += "".join(PatternMatching._char_to_digit(ch) for ch in pid[pos:pos+length])
+            pos += length
+        return [{'change_bits': best[0][0][0], 'converted_pid': converted_pid}]
+
 class PatternMatching:
+    """
+        Match a pid to a list of expanded patterns, or to a PatternAutomaton which only returns the best result
+    """
     def __init__(self, pid, potential_list):
         self.pid = pid
         self.potential_list = potential_list
@@ -273,6 +332,10 @@ class PatternMatching:
         """
             pattern matching pipeline, match pattern to the pid and convert the pid based on the rules
         """
+        if isinstance(self.potential_list, PatternAutomaton):
+            self.potential_result = self.potential_list.match(self.pid)
+            return
+
         # filter out the patterns that don't match the pid length
         removed_pattern = []
         for pattern in self.potential_list:
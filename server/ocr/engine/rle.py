@@ -0,0 +1,108 @@
+"""
+Run-length helpers shared by image2string and SigmaOCR.
+
+All functions work on whole images with numpy and avoid per-row or per-column Python loops.
+"""
+import numpy
+
+
+def _true_runs(flags):
+    """(Internal function, Do not call from outside)
+    Get the runs of consecutive True values of a 1-D boolean array
+    :param flags: 1-D boolean array
+    :return: (starts, ends) arrays, ends are inclusive
+    """
+    edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], flags.astype(numpy.int8), [0]))))
+    return edges[0::2], edges[1::2] - 1
+
+
+def get_intervals(img):
+    """Get intervals between characters, the runs of columns that are (almost) all white
+    :param img: 2-D binary image, white background
+    :return: a list of tuples (start, end) represents a list of intervals, end is inclusive
+    """
+    background = numpy.abs(255 - img.astype(numpy.int64)).sum(axis=0) < 255
+    starts, ends = _true_runs(background)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def get_block_heights(img, blocks):
+    """Get the height of the black pixels of every word block
+    :param img: 2-D binary image, white background
+    :param blocks: a list of tuples (start, end), the block covers columns start to end-1
+    :return: a list of heights, the full image height for a block without black pixels
+    """
+    height, width = img.shape
+    if not blocks:
+        return []
+    cumulative = numpy.zeros((height, width + 1), dtype=numpy.int64)
+    numpy.cumsum(img == 0, axis=1, out=cumulative[:, 1:])
+    starts = numpy.clip([block[0] for block in blocks], 0, width)
+    ends = numpy.clip([block[1] for block in blocks], 0, width)
+    has_black = (cumulative[:, ends] - cumulative[:, starts]) > 0
+    top = has_black.argmax(axis=0)
+    bottom = height - 1 - has_black[::-1].argmax(axis=0)
+    heights = numpy.where(has_black.any(axis=0), bottom - top + 1, height)
+    return heights.tolist()
+
+
+def _streak(flags):
+    """(Internal function, Do not call from outside)
+    Get the number of consecutive True values starting at every position of a 1-D boolean array
+    """
+    n = flags.shape[0]
+    position = numpy.arange(n)
+    next_false = numpy.minimum.accumulate(numpy.where(flags, n, position)[::-1])[::-1]
+    return next_false - position
+
+
+def encode_rows(img):
+    """Run-length encode every row of a 2-D image in one pass
+    :param img: 2-D image
+    :return: (rows, starts, lengths, values), 1-D arrays with one element per run in row-major order
+    """
+    height, width = img.shape
+    run_start = numpy.ones((height, width), dtype=bool)
+    numpy.not_equal(img[:, 1:], img[:, :-1], out=run_start[:, 1:])
+    rows, starts = numpy.nonzero(run_start)
+    values = img[rows, starts]
+    ends = numpy.full(starts.shape, width)
+    same_row = rows[1:] == rows[:-1]
+    ends[:-1][same_row] = starts[1:][same_row]
+    return rows, starts, ends - starts, values
+
+
+def get_border_lines(img, bg_color, ratio):
+    """Finds the rows that contain border lines from the run-length encoding of the image
+    :param img: 2-D image (grayscale or binary)
+    :param bg_color: background color, an integer value between 0 and 255
+    :param ratio: a line is longer than int(width*ratio), a dashed line repeats over it
+    :return: (index, row)
+        index: a list of row indices that contain a dashed line, or a line that is not background,
+               longer than the ratio and touches the border of the image (once per such line)
+        row: a list of [index, start, end, color] for every line that is not background and longer than the ratio
+    """
+    height, width = img.shape
+    if not height or not width:
+        return [], []
+    rows, starts, lengths, values = encode_rows(img)
+    n = rows.shape[0]
+    limit = int(width * ratio)
+    row_end = numpy.cumsum(numpy.bincount(rows, minlength=height))[rows]
+
+    # dashed line: the (length, color) pair of runs j, j+1 repeats at least 3 times from run j
+    same = numpy.zeros(n, dtype=bool)
+    same[:-2] = (rows[2:] == rows[:-2]) & (lengths[2:] == lengths[:-2]) & (values[2:] == values[:-2])
+    streak = _streak(same)
+    pair = numpy.zeros(n, dtype=numpy.int64)
+    pair[:-1] = numpy.where(rows[1:] == rows[:-1], lengths[:-1] + lengths[1:], 0)
+    times = numpy.where(pair > 0, limit // numpy.maximum(pair, 1), 0)
+    dashed = (times >= 3) & (streak >= 2 * times - 2) & (numpy.arange(n) + 2 * times <= row_end)
+    dashed_rows = numpy.bincount(rows[dashed], minlength=height) > 0
+
+    # solid line longer than the ratio, counted once more if it touches the border
+    long_run = (values != bg_color) & (lengths > limit)
+    touching = long_run & ((starts == 0) | (starts + lengths == width))
+    index = numpy.repeat(numpy.arange(height), dashed_rows + numpy.bincount(rows[touching], minlength=height))
+    row = numpy.stack([rows, starts, starts + lengths, values.astype(numpy.int64)], axis=1)[long_run]
+    return index.tolist(), row.tolist()
@@ -1,25 +1,35 @@
+import hashlib
 import json
 import os
-import pickle
 import logging
-import subprocess
-from collections import Counter
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from os import listdir
 from os.path import isfile, join
 
 import cv2
 import numpy as np
-import PIL
-from sklearn.svm import SVC
 
+from ocr import metrics
+from ocr.cache import LRUCache
 from ocr.engine import __version__
-from ocr.engine.image2string import image_filter, imagefile_to_digit_string, _get_index
+from ocr.engine.classifier import HOGClassifier, ModelRegistry
+from ocr.engine.image2string import image_filter, imagebuffer_to_digit_string, _get_border_columns
 from ocr.engine.pattern import ConvertStrToPatternList, PatternMatching
+from ocr.engine.rle import get_intervals
+from ocr.engine.tesseract import ENGINE_SUBPROCESS, create_engine
 
 _logger = logging.getLogger(__name__)
 
-with open(os.path.join(os.path.dirname(__file__), 'svm.sav'), 'rb') as f:
-    CLF = pickle.load(f)
+_pool = threading.local()
+
+MODE_LEGACY = 'legacy'
+MODE_APPLY = 'apply'
+
+MODELS = ModelRegistry()
+CLASSIFIER = HOGClassifier(MODELS)
 
 
 class SetupNotJustOneFileError(Exception):
@@ -34,25 +44,33 @@ class EmptyImageError(Exception):
     pass
 
 
+def strip_digest(img):
+    """Hash the exact pixels tesseract recognizes a filtered strip from, with their shape and dtype."""
+    digest = hashlib.sha1(np.ascontiguousarray(img).tobytes())
+    digest.update('{}{}'.format(img.shape, img.dtype).encode())
+    return digest.hexdigest()
+
+
 # Analyse image color
 class ColorAnalyser:
     def __init__(self, img):
         self.src = img
         self.colors_count = {}
+        self._background = None
 
     def count_colors(self):
-        (channel_b, channel_g, channel_r) = cv2.split(self.src)
-
-        channel_b = channel_b.flatten()
-        channel_g = channel_g.flatten()
-        channel_r = channel_r.flatten()
-
-        for i in range(len(channel_b)):
-            BGR = (channel_b[i], channel_g[i], channel_r[i])
-            if BGR in self.colors_count:
-                self.colors_count[BGR] += 1
-            else:
-                self.colors_count[BGR] = 1
+        """Count every BGR color once, with a histogram of the colors packed into uint32."""
+        if self._background is not None:
+            return
+        pixels = self.src.reshape(-1, 3).astype(np.uint32)
+        packed = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+        colors, first, counts = np.unique(packed, return_index=True, return_counts=True)
+        # the first color reaching the max count in scan order is the background, like max() over the dict
+        order = np.argsort(first, kind='stable')
+        colors, counts = colors[order], counts[order]
+        bgr = np.stack([(colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF], axis=1).astype(self.src.dtype)
+        self.colors_count = dict(zip(map(tuple, bgr), counts.tolist()))
+        self._background = tuple(bgr[np.argmax(counts)])
 
     def show_colors(self):
         for keys in sorted(self.colors_count, key=self.colors_count.__getitem__, reverse=True):
@@ -60,7 +78,7 @@ class ColorAnalyser:
 
     def get_background_color(self):
         self.count_colors()
-        return max(self.colors_count, key=lambda key: self.colors_count[key])
+        return self._background
 
 
 class SigmaOCR:
@@ -69,10 +87,19 @@ class SigmaOCR:
         self.len = -1
         self.bgColorSet = set([])
         self.offset = 10
+        self.engine = None
+        self.engine_name = None
+        self.legacy_engine = None
+        self.executor = None
+        self.workers = 1
+        self.quorum = 0
+        self.cache = None
+        self.set_engine(ENGINE_SUBPROCESS)
+        self.pattern_str = pattern_str
         if pattern_str:
             converter = ConvertStrToPatternList(pattern_str)
             converter.process()
-            self.pattern = converter.get_pattern_list()
+            self.pattern = converter.get_automaton()
         else:
             self.pattern = []
         _logger.info("------You are running SigmaOCR Version %s ------" % __version__)
@@ -83,40 +110,109 @@ class SigmaOCR:
         except OSError:
             pass
 
-    @staticmethod
-    def tesseract(image_file, result_file, whitelist):
+    def set_engine(self, name, workers=1):
+        """Switch the tesseract backend, "subprocess" or "tesserocr" with one API handle per worker."""
+        for engine in (self.engine, self.legacy_engine):
+            if engine is not None:
+                engine.close()
+        self.engine = create_engine(name, lang='combine', size=workers)
+        self.engine_name = name
+        self.legacy_engine = create_engine(name, size=workers)
+
+    def set_workers(self, workers):
+        """Preprocess and recognize the images of one request on a pool of threads, 1 runs them in sequence.
+
+        OpenCV and tesseract release the GIL, so threads run these stages in parallel.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.workers = workers
+        if workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+
+    def tesseract(self, img):
         # call tesseract for OCR
-        cmd = [
-            'tesseract', image_file, result_file,
-            '-c', 'tessedit_char_whitelist={}'.format(whitelist),
-            '--psm', '6', '--oem', '0', '-l', 'combine'
-        ]
-        subprocess.call(cmd, shell=False)
-        # read result file and return the result
-        with open(result_file + '.txt') as f:
-            text = f.readline().strip().replace(" ", "").replace("\n", "")
-            return text
-
-    def ocr_process(self, json_file, image_dir, threshold, patient_id=''):
+        return self.engine.recognize(img, self.whitelist_char)
+
+    @staticmethod
+    def read_images(image_dir):
+        """Read all files of a folder into the {file name: encoded bytes} mapping taken by ocr_process."""
+        images = OrderedDict()
+        for f in listdir(image_dir):
+            if isfile(join(image_dir, f)):
+                with open(join(image_dir, f), 'rb') as fp:
+                    images[f] = fp.read()
+        return images
+
+    @staticmethod
+    @metrics.timed('decode')
+    def _decode(buf):
+        """Decode encoded image bytes to a BGR ndarray, like cv2.imread."""
+        return cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+
+    @staticmethod
+    def _debug_write(debug_dir, name, suffix, img):
+        """Write an intermediate image only when debugging is on."""
+        if debug_dir:
+            cv2.imwrite(join(debug_dir, "{}_{}.png".format(os.path.splitext(name)[0], suffix)), img)
+
+    def ocr_process(self, json_file, images, threshold, patient_id='', debug_dir=None, stats=None):
+        """Run setup or apply on uploaded images, a {file name: encoded bytes} mapping.
+
+        Nothing is written to disk unless debug_dir is given, then the intermediate images are saved there.
+        If stats is a dict, apply fills in how many classified images were recognized and skipped.
+        """
         if patient_id:
-            return self.ocr_setup(json_file, image_dir, patient_id)
+            return self.ocr_setup(json_file, images, patient_id, debug_dir)
         else:
-            return self.ocr_apply(json_file, image_dir, threshold)
+            return self.ocr_apply(json_file, images, threshold, debug_dir, stats)
 
-    def ocr_legacy(self, image_file):
-        return imagefile_to_digit_string(image_file, self.whitelist_char, removeboundingbox=False)
+    def ocr_batch(self, json_file, items, debug_dir=None):
+        """Recognize independent strips on the worker pool, one result per item in input order.
 
-    def ocr_setup(self, json_file, image_dir, patient_id):
+        Each item is a dict with 'name', 'buf' (encoded bytes), 'mode' ("legacy" or "apply") and 'threshold'
+        (None or an int, for apply). Each result has the name, mode, status ("ok", "empty" or "error"), text,
+        error message and the seconds spent on the item.
+        """
+        return self._map(lambda item: self._batch_item(json_file, item, debug_dir), items)
+
+    def _batch_item(self, json_file, item, debug_dir=None):
+        start = time.perf_counter()
+        name, mode = item['name'], item.get('mode') or MODE_LEGACY
+        result = {'name': name, 'mode': mode, 'status': 'ok', 'text': '', 'error': ''}
+        try:
+            if mode == MODE_LEGACY:
+                text = self.ocr_legacy(item['buf'])
+            elif mode == MODE_APPLY:
+                threshold = {} if item.get('threshold') is None else {name: item['threshold']}
+                text = self.ocr_apply(json_file, {name: item['buf']}, threshold, debug_dir)
+            else:
+                raise ValueError('Unsupported OCR mode: {}'.format(mode))
+            result['text'] = text
+            if not text:
+                result['status'] = 'empty'
+        except Exception as e:
+            _logger.exception('OCR batch item failed: {}'.format(name))
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 6)
+        return result
+
+    def ocr_legacy(self, buf):
+        with metrics.stage('legacy'):
+            return imagebuffer_to_digit_string(buf, self.whitelist_char, removeboundingbox=False, engine=self.legacy_engine)
+
+    def ocr_setup(self, json_file, images, patient_id, debug_dir=None):
         assert patient_id
-        _logger.info('ocr setup: {}'.format(image_dir))
+        _logger.info('ocr setup: {}'.format(list(images)))
         # add background color of the image to the bgColorSet
         try:
-            img_list = [join(image_dir, f) for f in listdir(image_dir) if isfile(join(image_dir, f))]
-            if len(img_list) != 1:
+            if len(images) != 1:
                 raise SetupNotJustOneFileError
             else:
-                img = cv2.imread(img_list[0])
-                if img.size:
+                img = self._decode(next(iter(images.values())))
+                if img is not None and img.size:
                     color_count, bg_color = self._get_colors(img)
                 else:
                     raise EmptyImageError
@@ -138,7 +234,7 @@ class SigmaOCR:
         img = img[lower:upper]
 
         # calculate threshold for column cropping
-        intervals = self._get_interval(binary_img[lower:upper])
+        intervals = get_intervals(binary_img[lower:upper])
         thres = -1
         for itv in intervals:
             if itv[0] <= self.offset <= itv[1]:
@@ -155,23 +251,12 @@ class SigmaOCR:
             img = cv2.resize(img, (300, 64), interpolation=cv2.INTER_LINEAR)
 
         # image preprocessing
-        img = image_filter(img)
-
-        pil_img = PIL.Image.fromarray(img.astype('uint8'), 'L')
-        prefix_name = join(image_dir, os.path.splitext(os.path.basename(img_list[0]))[0])
-        temp_image_file = "{}_tmp.png".format(prefix_name)
-        result_file_path = "{}_tmp".format(prefix_name)
-        pil_img.save(temp_image_file, dpi=(300, 300))
+        with metrics.stage('image_filter'):
+            img = image_filter(img)
+        self._debug_write(debug_dir, next(iter(images)), 'tmp', img)
 
         # call tesseract for OCR
-        text = self.tesseract(temp_image_file, result_file_path, self.whitelist_char)
-
-        if self.pattern:
-            match = PatternMatching(text, self.pattern)
-            match.process()
-            converted_text = match.get_potential_result()
-            if converted_text:
-                text = converted_text[0]['converted_pid']
+        text = self._recognize(img)
 
         # save the json file only if the recognition is correct
         # if text == patient_id:
@@ -180,115 +265,179 @@ class SigmaOCR:
             self._json_dump(params, json_file)
         return text, thres
 
-    def ocr_apply(self, json_file, image_dir, threshold):
-        # get all file names in the folder
-        img_name_list = [join(image_dir, f) for f in listdir(image_dir) if isfile(join(image_dir, f))]
-
+    def ocr_apply(self, json_file, images, threshold, debug_dir=None, stats=None):
         with open(json_file, 'r') as f:
             params = json.load(f)
 
-        # some initial filtering of the images
-        img_list = []
-        name_list = []
-        for imgName in img_name_list:
-            _logger.info('ocr apply: {}'.format(imgName))
-            img = cv2.imread(imgName)
-            if img.size:
-                color_count, bg_color = self._get_colors(img)
-            else:
-                _logger.warning("Empty image: {}".format(imgName))
-                continue
-
-            if len(color_count) == 1:
-                _logger.warning("Only one color in this image: {}".format(imgName))
-                continue
-            bg_color = list(map(int, bg_color))
-
-            if not self._bg_color_has_appeared(bg_color, params['bgColor']):
-                # if the background color of the image is not among the background colors at setup up,
-                # filter out the image
-                _logger.warning("Background color filterled: {}".format(imgName))
-                continue
-            else:
-                binary_img = self._image_binarize(img)
-                if not self._has_foreground(binary_img):
-                    # if the center row of the image has no foreground, filter out the image
-                    _logger.warning("Centerline no foreground: {}".format(imgName))
-                    continue
-                else:
-                    basename = os.path.basename(imgName)
-                    thres = threshold.get(basename, 1)
-                    print('thres: ', thres)
-                    prefix_name = join(image_dir, os.path.splitext(basename)[0])
-
-                    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                    img = self._remove_bbox_part(img_gray, img, bg_color)
-                    img = self._remove_bbox_part(binary_img, img, bg_color)
-                    binary_img = self._image_binarize(img)
-
-                    upper, lower = self._row_cropping(binary_img, True)
-                    img = img[upper:lower]
-
-                    cv2.imwrite("{}_cropped.png".format(prefix_name), img)
-                    intervals = self._get_interval(binary_img[upper:lower])
-                    left = -1
-                    margin = 0
-                    for pos, itv in enumerate(intervals):
-                        if itv[1]-itv[0]+1 >= thres-1 and pos < len(intervals)/2:
-                            left = itv[1]+1-(itv[1]-itv[0])//2
-                            margin = (itv[1]-itv[0])//2
-                            break
-
-                    img_transpose = img.transpose(1, 0, 2)
-                    width = img_transpose.shape[0]
-                    right_bound = min(left+width-2*self.offset+margin, width-1)
-                    if left >= 0:
-                        img_transpose_cropped = img_transpose[left:right_bound]
-                    else:
-                        img_transpose_cropped = img_transpose[:-self.offset]
-
-                    img = cv2.resize(img_transpose_cropped,(64, 300), interpolation=cv2.INTER_LINEAR)
-                    img_list.append(img)
-                    name_list.append(imgName)
+        # some initial filtering of the images, each image is preprocessed independently
+        prepared = self._map(lambda item: self._apply_preprocess(item[0], item[1], params['bgColor'], threshold, debug_dir),
+                             images.items())
+        name_list = [name for name, img in zip(images, prepared) if img is not None]
+        img_list = [img for img in prepared if img is not None]
 
         if not img_list:
-            _logger.warning('Valid image not found in {}'.format(image_dir))
+            _logger.warning('Valid image not found in {}'.format(list(images)))
             return ''
 
-        # extract the HOG features from all the images
-        gradient_list = []
-        self._compute_HOGs(img_list, gradient_list)
-
-        # classifiy the image on their HOG features
-        class_prediction = CLF.predict(np.array(gradient_list))
-        # print(class_prediction)
-        results = []
-        for i, v in enumerate(class_prediction):
-            # if is classified valid, processed the image and put into OCR engine
-            if v == 1:
-                prefix_name = join(image_dir, os.path.splitext(os.path.basename(name_list[i]))[0])
-                img = img_list[i].transpose(1,0,2)
-                cv2.imwrite("{}_abc.png".format(prefix_name), img)
-                img = image_filter(img)
-                pil_img = PIL.Image.fromarray(img.astype('uint8'), 'L')
-                temp_image_file = "{}_tmp.png".format(prefix_name)
-                result_file_path = "{}_tmp".format(prefix_name)
-                pil_img.save(temp_image_file, dpi=(300, 300))
-                text = self.tesseract(temp_image_file, result_file_path, self.whitelist_char)
-                if self.pattern:
-                    match = PatternMatching(text, self.pattern)
-                    match.process()
-                    converted_text = match.get_potential_result()
-                    if converted_text:
-                        text = converted_text[0]['converted_pid']
-
-                if self.len <= 0 or len(text) == self.len:
-                    results.append(text)
+        # classifiy the images on their HOG features, as one batch
+        class_prediction, scores = CLASSIFIER.classify(img_list, scores=self.quorum > 0)
+        # if is classified valid, processed the image and put into OCR engine
+        candidates = [i for i, v in enumerate(class_prediction) if v == 1]
+        metrics.inc(metrics.REJECTED_IMAGES, len(img_list) - len(candidates), reason='classifier')
+
+        def recognize(indices):
+            texts = self._map(lambda i: self._apply_recognize(name_list[i], img_list[i], debug_dir), indices)
+            valid = [text for text in texts if self.len <= 0 or len(text) == self.len]
+            metrics.inc(metrics.REJECTED_IMAGES, len(texts) - len(valid), reason='length')
+            return valid
+
+        if self.quorum > 0:
+            # most confident candidates first, stop once enough recognitions agree
+            candidates.sort(key=lambda i: scores[i], reverse=True)
+            results, recognized = self._vote_until_quorum(candidates, recognize)
+        else:
+            results, recognized = recognize(candidates), len(candidates)
+        if stats is not None:
+            stats['recognized'] = recognized
+            stats['skipped'] = len(candidates) - recognized
 
         counter = Counter(results)
         most = counter.most_common(1)
         return most and most[0][0] or ''
 
+    def _vote_until_quorum(self, candidates, recognize):
+        """Recognize candidates one wave (a pool's worth) at a time until self.quorum results agree.
+
+        Returns the results so far and the number of recognized candidates.
+        """
+        wave = max(1, self.workers)
+        results = []
+        recognized = 0
+        counter = Counter()
+        while recognized < len(candidates):
+            texts = recognize(candidates[recognized:recognized + wave])
+            recognized = min(recognized + wave, len(candidates))
+            results.extend(texts)
+            counter.update(texts)
+            if counter and counter.most_common(1)[0][1] >= self.quorum:
+                break
+        return results, recognized
+
+    def _apply_preprocess(self, imgName, buf, bg_colors, threshold, debug_dir=None):
+        """Decode, filter and crop one image for ocr_apply, returns None if the image is filtered out."""
+        _logger.info('ocr apply: {}'.format(imgName))
+        img = self._decode(buf)
+        if img is not None and img.size:
+            color_count, bg_color = self._get_colors(img)
+        else:
+            _logger.warning("Empty image: {}".format(imgName))
+            metrics.reject('empty')
+            return None
+
+        if len(color_count) == 1:
+            _logger.warning("Only one color in this image: {}".format(imgName))
+            metrics.reject('one_color')
+            return None
+        bg_color = list(map(int, bg_color))
+
+        if not self._bg_color_has_appeared(bg_color, bg_colors):
+            # if the background color of the image is not among the background colors at setup up,
+            # filter out the image
+            _logger.warning("Background color filterled: {}".format(imgName))
+            metrics.reject('background')
+            return None
+
+        binary_img = self._image_binarize(img)
+        if not self._has_foreground(binary_img):
+            # if the center row of the image has no foreground, filter out the image
+            _logger.warning("Centerline no foreground: {}".format(imgName))
+            metrics.reject('no_foreground')
+            return None
+
+        thres = threshold.get(imgName, 1)
+        _logger.debug('{} thres: {}'.format(imgName, thres))
+
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        img = self._remove_bbox_part(img_gray, img, bg_color)
+        img = self._remove_bbox_part(binary_img, img, bg_color)
+        binary_img = self._image_binarize(img)
+
+        return self._apply_crop(imgName, img, binary_img, thres, debug_dir)
+
+    @metrics.timed('crop')
+    def _apply_crop(self, imgName, img, binary_img, thres, debug_dir=None):
+        """Crop the rows and the columns around the ID, resized to the classifier input."""
+        upper, lower = self._row_cropping(binary_img, True)
+        img = img[upper:lower]
+
+        self._debug_write(debug_dir, imgName, 'cropped', img)
+        intervals = get_intervals(binary_img[upper:lower])
+        left = -1
+        margin = 0
+        for pos, itv in enumerate(intervals):
+            if itv[1]-itv[0]+1 >= thres-1 and pos < len(intervals)/2:
+                left = itv[1]+1-(itv[1]-itv[0])//2
+                margin = (itv[1]-itv[0])//2
+                break
+
+        img_transpose = img.transpose(1, 0, 2)
+        width = img_transpose.shape[0]
+        right_bound = min(left+width-2*self.offset+margin, width-1)
+        if left >= 0:
+            img_transpose_cropped = img_transpose[left:right_bound]
+        else:
+            img_transpose_cropped = img_transpose[:-self.offset]
+
+        return cv2.resize(img_transpose_cropped, (64, 300), interpolation=cv2.INTER_LINEAR)
+
+    def _apply_recognize(self, imgName, img, debug_dir=None):
+        """Filter one classified image and recognize it."""
+        img = img.transpose(1, 0, 2)
+        self._debug_write(debug_dir, imgName, 'abc', img)
+        with metrics.stage('image_filter'):
+            img = image_filter(img)
+        self._debug_write(debug_dir, imgName, 'tmp', img)
+        return self._recognize(img)
+
+    def _recognize(self, img):
+        """Recognize a filtered image and match the pattern, through the result cache if enabled."""
+        if self.cache is None:
+            return self._match_pattern(self.tesseract(img))
+        key = (strip_digest(img), self.engine_name, self.whitelist_char, self.pattern_str, self.len)
+        text = self.cache.get(key)
+        if text is None:
+            metrics.inc(metrics.CACHE_MISSES)
+            text = self._match_pattern(self.tesseract(img))
+            self.cache.put(key, text)
+        else:
+            metrics.inc(metrics.CACHE_HITS)
+        return text
+
+    @metrics.timed('pattern')
+    def _match_pattern(self, text):
+        """Convert the recognized text to the closest configured pattern."""
+        if self.pattern:
+            match = PatternMatching(text, self.pattern)
+            match.process()
+            converted_text = match.get_potential_result()
+            if converted_text:
+                text = converted_text[0]['converted_pid']
+        return text
+
+    def _map(self, func, iterable):
+        """Map over the worker pool if there is one, keeping the input order.
+
+        A map called from a pool thread runs in sequence, so a worker never waits on its own pool.
+        """
+        if self.executor is None or getattr(_pool, 'worker', False):
+            return list(map(func, iterable))
+
+        def run(item):
+            _pool.worker = True
+            return func(item)
+
+        return list(self.executor.map(run, iterable))
+
     @staticmethod
     def _json_dump(para, jsonfile):
         if not os.path.isfile(jsonfile) or os.stat(jsonfile).st_size == 0:
@@ -333,13 +482,21 @@ class SigmaOCR:
     def set_offset(self, offset):
         self.offset = offset
 
+    def set_cache(self, size, ttl=None):
+        """Cache recognized text by the hash of the filtered image and the engine, size 0 disables the cache."""
+        self.cache = LRUCache(size, ttl) if size > 0 else None
+
+    def cache_info(self):
+        return self.cache.stats() if self.cache is not None else {}
+
     @staticmethod
-    def _compute_HOGs(img_lst, gradient_lst):
-        hog = cv2.HOGDescriptor()
-        for i in range(len(img_lst)):
-            roi = img_lst[i]
-            features = hog.compute(roi)
-            gradient_lst.append(features.flatten())
+    def model_info():
+        """Version, file hash and load time of the classifier model, empty until it is first used."""
+        return MODELS.info()
+
+    def set_quorum(self, quorum):
+        """Stop recognizing once this many results agree, most confident images first. 0 recognizes all."""
+        self.quorum = quorum
 
     def _set_bg_color(self, img_name):
         analyser = ColorAnalyser(img_name)
@@ -347,6 +504,7 @@ class SigmaOCR:
         self.bgColorSet.add(bg_color)
 
     @staticmethod
+    @metrics.timed('colors')
     def _get_colors(img):
         analyser = ColorAnalyser(img)
         analyser.count_colors()
@@ -408,34 +566,6 @@ class SigmaOCR:
             flag_list.append(f)
         return np.array(flag_list).any()
 
-    @staticmethod
-    def _get_interval(img):
-        rotated = img.transpose(1, 0)
-        height, width = rotated.shape[:2]
-        bg_row = np.array([255]*width)
-        flag = False
-        start = -1
-        end = -1
-        lst = []
-        for i in range(height):
-            if (abs(bg_row-rotated[i])).sum() < 255:
-                if not flag:
-                    flag = True
-                    start = i
-                    end = start
-                else:
-                    end = max(start, i)
-            else:
-                flag = False
-                if start >= 0:
-                    lst.append((start, end))
-                    start = -1
-
-        if flag:
-            lst.append((start, end))
-
-        return lst
-
     @staticmethod
     def _get_background_color(img):
         """(Internal function, Do not call from outside)
@@ -452,20 +582,7 @@ class SigmaOCR:
 
         return values[ind]
 
+    @metrics.timed('bbox')
     def _remove_bbox_part(self, mask_img, img, bg_color):
-        mask_bg_color = self._get_background_color(mask_img)
-        row_index, rows = _get_index(mask_img, mask_bg_color, "row")
-        col_index, cols = _get_index(mask_img.transpose(1, 0), mask_bg_color, "col")
-        for row in rows:
-            for col in cols:
-                if row[1] <= col[0] <= row[2] and abs(int(col[3])-int(row[3])) < 3:
-                    # row_index.append(row[0])
-                    col_index.append(col[0])
-        col_index = list(set(col_index))
-        # row_index = list(set(row_index))
-        for i in col_index:
-            img[:, i] = bg_color
-        #for i in row_index:
-        #    img[i, :] = bg_color
-
+        img[:, _get_border_columns(mask_img)] = bg_color
         return img
@@ -0,0 +1,192 @@
+"""
+Tesseract backends used by the OCR engine.
+
+Two interchangeable backends are provided:
+  - SubprocessTesseract: spawns the `tesseract` executable for every image (the historical behaviour)
+  - TesserocrPool: keeps a pool of warm in-process Tesseract API handles (requires tesserocr)
+
+Both take a 2-D uint8 numpy image and return the first recognized line with blanks removed.
+Images are handed over in memory, nothing is written to disk.
+"""
+import contextlib
+import io
+import logging
+import queue
+import subprocess
+import threading
+import warnings
+
+import PIL.Image
+
+from ocr import metrics
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+_logger = logging.getLogger(__name__)
+
+ENGINE_SUBPROCESS = 'subprocess'
+ENGINE_TESSEROCR = 'tesserocr'
+
+# page segmentation mode 6: assume a single uniform block of text
+DEFAULT_PSM = 6
+# engine mode 0: legacy tesseract only
+DEFAULT_OEM = 0
+DEFAULT_DPI = 300
+
+
+def _first_line(text):
+    """Keep the first recognized line and strip all blanks, as the OCR pipeline expects."""
+    return text.split("\n", 1)[0].strip().replace(" ", "")
+
+
+def _parse_boxes(text):
+    """Parse tesseract box output ("char left bottom right top page" per line) to a dict of lists."""
+    boxes = {'char': [], 'left': [], 'bottom': [], 'right': [], 'top': [], 'page': []}
+    for line in text.splitlines():
+        fields = line.split(' ')
+        if len(fields) != 6:
+            continue
+        boxes['char'].append(fields[0])
+        for key, value in zip(('left', 'bottom', 'right', 'top', 'page'), fields[1:]):
+            boxes[key].append(int(value))
+    return boxes
+
+
+def _encode_png(img):
+    """Encode a grayscale ndarray image to PNG bytes tagged with the DPI tesseract expects."""
+    buf = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # Suppress warning message
+        PIL.Image.fromarray(img.astype('uint8'), 'L').save(buf, format='PNG', dpi=(DEFAULT_DPI, DEFAULT_DPI))
+    return buf.getvalue()
+
+
+class SubprocessTesseract:
+    """Run the tesseract executable once per image, piping the image through stdin/stdout."""
+
+    def __init__(self, lang=None, psm=DEFAULT_PSM, oem=DEFAULT_OEM):
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+
+    def _command(self, whitelist, *configs):
+        cmd = [
+            'tesseract', 'stdin', 'stdout',
+            '-c', 'tessedit_char_whitelist={}'.format(whitelist),
+            '--psm', str(self.psm), '--oem', str(self.oem)
+        ]
+        if self.lang:
+            cmd += ['-l', self.lang]
+        return cmd + list(configs)
+
+    def _run(self, img, cmd):
+        metrics.inc(metrics.TESSERACT_CALLS, engine=ENGINE_SUBPROCESS)
+        with metrics.stage('tesseract'):
+            process = subprocess.run(cmd, input=_encode_png(img), stdout=subprocess.PIPE, shell=False)
+        return process.stdout.decode('utf-8', errors='ignore')
+
+    def recognize(self, img, whitelist):
+        """Recognize a grayscale ndarray image."""
+        return _first_line(self._run(img, self._command(whitelist)))
+
+    def boxes(self, img, whitelist):
+        """Get the bounding box of every recognized character."""
+        return _parse_boxes(self._run(img, self._command(whitelist, 'batch.nochop', 'makebox')))
+
+    def close(self):
+        pass
+
+
+class TesserocrPool:
+    """A pool of in-process Tesseract API handles, each initialized once with lang/PSM/OEM.
+
+    Handles are created lazily up to `size` and reused; a caller blocks while all handles are busy.
+    """
+
+    def __init__(self, lang=None, psm=DEFAULT_PSM, oem=DEFAULT_OEM, size=1):
+        if tesserocr is None:
+            raise ImportError('tesserocr is required by the "{}" OCR engine'.format(ENGINE_TESSEROCR))
+        self.lang = lang or 'eng'
+        self.psm = psm
+        self.oem = oem
+        self.size = max(1, size)
+        self._handles = queue.Queue()
+        self._whitelists = {}
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.psm, oem=self.oem)
+        _logger.info('Tesseract API handle initialized: lang={}, psm={}, oem={}'.format(self.lang, self.psm, self.oem))
+        return api
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Borrow a handle from the pool."""
+        while True:
+            with self._lock:
+                reserved = self._handles.empty() and self._created < self.size
+                if reserved:
+                    self._created += 1
+            if not reserved:
+                api = self._handles.get()
+                if api is not None:
+                    break
+                # a failed creation gave its slot back, try to take it
+                continue
+            # created outside the lock, loading the traineddata takes long
+            try:
+                api = self._create()
+                break
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                # wake a caller waiting for a handle, it may create one in the freed slot
+                self._handles.put(None)
+                raise
+        try:
+            yield api
+        finally:
+            self._handles.put(api)
+
+    def _set_image(self, api, img, whitelist):
+        if self._whitelists.get(id(api)) != whitelist:
+            api.SetVariable('tessedit_char_whitelist', whitelist)
+            self._whitelists[id(api)] = whitelist
+        api.SetImage(PIL.Image.fromarray(img.astype('uint8'), 'L'))
+        api.SetSourceResolution(DEFAULT_DPI)
+
+    def recognize(self, img, whitelist):
+        """Recognize a grayscale ndarray image."""
+        metrics.inc(metrics.TESSERACT_CALLS, engine=ENGINE_TESSEROCR)
+        with self.acquire() as api, metrics.stage('tesseract'):
+            self._set_image(api, img, whitelist)
+            return _first_line(api.GetUTF8Text())
+
+    def boxes(self, img, whitelist):
+        """Get the bounding box of every recognized character."""
+        metrics.inc(metrics.TESSERACT_CALLS, engine=ENGINE_TESSEROCR)
+        with self.acquire() as api, metrics.stage('tesseract'):
+            self._set_image(api, img, whitelist)
+            return _parse_boxes(api.GetBoxText(0))
+
+    def close(self):
+        while not self._handles.empty():
+            api = self._handles.get()
+            if api is not None:
+                api.End()
+        self._whitelists.clear()
+        self._created = 0
+
+
+def create_engine(name=ENGINE_SUBPROCESS, lang=None, size=1):
+    """Create a tesseract backend by name ("subprocess" or "tesserocr")."""
+    if name == ENGINE_SUBPROCESS:
+        return SubprocessTesseract(lang)
+    elif name == ENGINE_TESSEROCR:
+        return TesserocrPool(lang, size=size)
+    else:
+        raise ValueError('Unsupported OCR engine: {}'.format(name))
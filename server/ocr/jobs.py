@@ -0,0 +1,146 @@
+# -*- coding=utf-8 -*-
+"""Bounded in-process job queue with a pool of worker threads.
+
+The state of every job is kept as a json file under the store folder, so any worker process sharing
+the folder can answer a poll, whichever process runs the job.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+POLL_INTERVAL = 0.1
+PURGE_INTERVAL = 60
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue(object):
+    """Run submitted functions on `workers` threads, refuse new jobs once `maxsize` are waiting.
+
+    Finished jobs are removed from the store after `ttl` seconds.
+    """
+
+    def __init__(self, store_dir, maxsize=64, workers=2, ttl=3600):
+        self.store_dir = store_dir
+        self.ttl = ttl
+        os.makedirs(store_dir, exist_ok=True)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._events = {}
+        self._lock = threading.Lock()
+        self._purged = 0
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._work, name='ocr-job-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _path(self, job_id):
+        return os.path.join(self.store_dir, '{}.json'.format(job_id))
+
+    def _write(self, job):
+        path = self._path(job['id'])
+        tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def _read(self, job_id):
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def submit(self, func, *args):
+        """Queue func(*args) and return the job id, raises QueueFullError if the queue is full."""
+        self._purge()
+        job = {'id': uuid.uuid4().hex, 'status': QUEUED, 'result': None, 'error': '',
+               'submitted': time.time(), 'started': None, 'finished': None}
+        self._write(job)
+        with self._lock:
+            self._events[job['id']] = threading.Event()
+        try:
+            self._queue.put_nowait((job, func, args))
+        except queue.Full:
+            with self._lock:
+                self._events.pop(job['id'], None)
+            os.remove(self._path(job['id']))
+            raise QueueFullError('OCR job queue is full ({} waiting)'.format(self._queue.maxsize))
+        return job['id']
+
+    def _work(self):
+        while True:
+            job, func, args = self._queue.get()
+            job['status'] = RUNNING
+            job['started'] = time.time()
+            self._write(job)
+            try:
+                job['result'] = func(*args)
+                job['status'] = DONE
+            except Exception as e:
+                _logger.exception('OCR job failed: {}'.format(job['id']))
+                job['error'] = str(e)
+                job['status'] = FAILED
+            job['finished'] = time.time()
+            self._write(job)
+            with self._lock:
+                event = self._events.pop(job['id'], None)
+            if event is not None:
+                event.set()
+            self._queue.task_done()
+
+    def get(self, job_id, wait=0):
+        """Get the state of a job, None if unknown.
+
+        With wait > 0, block up to wait seconds for the job to finish (long poll).
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            job = self._read(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            with self._lock:
+                event = self._events.get(job_id)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                # queued by another worker process, only the store tells
+                time.sleep(min(POLL_INTERVAL, remaining))
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _purge(self):
+        """Remove the job files older than the ttl, at most once per PURGE_INTERVAL."""
+        now = time.time()
+        if now - self._purged < PURGE_INTERVAL:
+            return
+        self._purged = now
+        for name in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
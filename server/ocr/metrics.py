@@ -0,0 +1,192 @@
+# -*- coding=utf-8 -*-
+"""Lightweight counters and latency histograms, exported in the Prometheus text format.
+
+Nothing is recorded until enable() is called; while disabled a timer or a counter costs a flag check.
+Metrics are kept per process.
+"""
+from __future__ import absolute_import
+
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+# upper bounds in seconds, from 1ms (a small numpy stage) to 10s (a whole request)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry(object):
+    """Counters and histograms keyed by name and labels."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.enabled = False
+        self.buckets = tuple(buckets)
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        """Set the type and help text of a metric, shown in the export."""
+        self._help[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def _timer(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timer(self, name, **labels):
+        """Context manager observing the seconds spent in its block."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name, labels)
+
+    def totals(self, name):
+        """Get [(labels, count, sum)] of a histogram."""
+        with self._lock:
+            return [(dict(labels), h[2], h[1]) for (key, labels), h in sorted(self._histograms.items()) if key == name]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Export all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                help_kind, text = self._help.get(name, (kind, ''))
+                if text:
+                    lines.append('# HELP {} {}'.format(name, text))
+                lines.append('# TYPE {} {}'.format(name, help_kind))
+
+        for (name, labels), value in counters:
+            header(name, COUNTER)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, HISTOGRAM)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), repr(total)))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for k, v in labels)
+    return '{' + ','.join(pairs) + '}'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = 'ocr_stage_seconds'
+REQUEST_SECONDS = 'ocr_http_request_seconds'
+CACHE_HITS = 'ocr_cache_hits_total'
+CACHE_MISSES = 'ocr_cache_misses_total'
+TESSERACT_CALLS = 'ocr_tesseract_calls_total'
+REJECTED_IMAGES = 'ocr_rejected_images_total'
+UPSTREAM_REQUESTS = 'ocr_upstream_requests_total'
+UPSTREAM_CONNECTIONS = 'ocr_upstream_connections_total'
+
+REGISTRY.describe(STAGE_SECONDS, HISTOGRAM, 'Seconds spent in each stage of the OCR pipeline.')
+REGISTRY.describe(REQUEST_SECONDS, HISTOGRAM, 'Seconds spent serving each HTTP endpoint.')
+REGISTRY.describe(CACHE_HITS, COUNTER, 'Recognitions answered by the OCR result cache.')
+REGISTRY.describe(CACHE_MISSES, COUNTER, 'Recognitions not found in the OCR result cache.')
+REGISTRY.describe(TESSERACT_CALLS, COUNTER, 'Images handed to tesseract.')
+REGISTRY.describe(REJECTED_IMAGES, COUNTER, 'Images dropped before recognition, by reason.')
+REGISTRY.describe(UPSTREAM_REQUESTS, COUNTER, 'Calls to the sigma server or cloud, by answer status.')
+REGISTRY.describe(UPSTREAM_CONNECTIONS, COUNTER, 'Connections opened to the sigma server or cloud, calls not opening one reuse one.')
+
+
+def enable(enabled=True):
+    REGISTRY.enabled = enabled
+
+
+def is_enabled():
+    return REGISTRY.enabled
+
+
+def inc(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def stage(name):
+    """Time a stage of the OCR pipeline: `with metrics.stage('decode'): ...`"""
+    if not REGISTRY.enabled:
+        return _NULL_TIMER
+    return REGISTRY.timer(STAGE_SECONDS, stage=name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as the stage `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reject(reason):
+    """Count an image dropped before recognition."""
+    REGISTRY.inc(REJECTED_IMAGES, reason=reason)
+
+
+def render():
+    return REGISTRY.render()
@@ -1,5 +1,6 @@
 import codecs
 import logging
+import logging.config
 import os
 import pathlib
 import platform
@@ -118,6 +119,42 @@ class Configuration(object):
     def get_ocr_offset(self):
         return self._context.get("ocr", dict).get("offset", 10)
 
+    def get_ocr_engine(self):
+        return self._context.get("ocr", dict).get("engine", "subprocess")
+
+    def get_ocr_workers(self):
+        return self._context.get("ocr", dict).get("workers", 1)
+
+    def get_ocr_quorum(self):
+        return self._context.get("ocr", dict).get("quorum", 0)
+
+    def get_ocr_cache(self):
+        return self._context.get("ocr", dict).get("cache", {})
+
+    def get_ocr_debug(self):
+        return self._context.get("ocr", dict).get("debug", False)
+
+    def get_ocr_metrics(self):
+        return self._context.get("ocr", dict).get("metrics", False)
+
+    def get_ocr_jobs(self):
+        return self._context.get("ocr", dict).get("jobs", {})
+
+    def get_query_cache(self):
+        return self._context.get("query", dict).get("cache", {})
+
+    def get_query_workers(self):
+        return self._context.get("query", dict).get("workers", 4)
+
+    def get_serving_workers(self):
+        return self._context.get("serving", dict).get("workers", 2)
+
+    def get_serving_threads(self):
+        return self._context.get("serving", dict).get("threads", 4)
+
+    def get_serving_timeout(self):
+        return self._context.get("serving", dict).get("timeout", 120)
+
     def get_database(self):
         database = self._context.get('database', {})
         if 'mongodb' in database.keys() or 'sqlite' in database.keys():
@@ -1,7 +1,10 @@
 import os
-import time
+import argparse
 import sqlite3
 import logging
+import pathlib
+import threading
+import contextlib
 
 from ocr.sigma.database.abstract import AbstractDataBase
 
@@ -13,53 +16,163 @@ STATUS_TRANS = {
     "pushed": "succeed"
 }
 
+# read-only connection pragmas: memory-map up to 256MB of the file, 16MB page cache (negative is KiB)
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE = -16000
+# milliseconds to wait while autorun holds a write lock
+DEFAULT_BUSY_TIMEOUT = 5000
+
+# columns find() filters on, in the order of the WHERE clause
+QUERY_COLUMNS = ("status", "series_instance_uid", "study_instance_uid", "patient_id", "accession_number")
+NOCASE_COLUMNS = ("patient_id",)
+
+# datetime is stored as 'Sun, 06 Nov 1994 08:49:37 GMT', rebuilt as '1994' '111' '06' '08:49:37' to sort as text,
+# the month is its position in the name list plus 100 to keep a fixed width
+SORTABLE_DATETIME = ("substr(datetime, 13, 4) || (instr('JanFebMarAprMayJunJulAugSepOctNovDec', substr(datetime, 9, 3)) + 100)"
+                     " || substr(datetime, 6, 2) || substr(datetime, 18, 8)")
+
 
 class SQLite(AbstractDataBase):
-    """Connect and query sqlite3."""
+    """Connect and query sqlite3.
+
+    Every thread gets its own read-only connection, opened on its first query. All connections are
+    re-opened when autorun.db is replaced by another file.
+    """
+
+    def __init__(self, db_name, host_name=None, mmap_size=DEFAULT_MMAP_SIZE, cache_size=DEFAULT_CACHE_SIZE,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._identity = None
+        self._generation = 0
+        super(SQLite, self).__init__(db_name, host_name)
+
+    def _stat(self):
+        """Identify the autorun.db file, None if missing."""
+        try:
+            st = os.stat(self.db_name)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
 
     def connect(self):
-        if os.path.exists(self.db_name):
-            self._client = sqlite3.connect(self.db_name, check_same_thread=False)
-            self._client.row_factory = SQLite.dict_factory
-            self._db = self._client.cursor()
-        else:
-            self._client = None
-            self._db = None
+        """Open the read-only connection of the calling thread, None if autorun.db is missing."""
+        self._release()
+        identity = self._stat()
+        if identity is None:
+            return None
+        with self._lock:
+            replaced = identity != self._identity
+            if replaced:
+                if self._identity is not None:
+                    _logger.info("DB autorun replaced, reconnect")
+                self._identity = identity
+            self._close_dead()
+            generation = self._generation
+        uri = pathlib.Path(os.path.abspath(self.db_name)).as_uri() + '?mode=ro'
+        client = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout / 1000.0, check_same_thread=False,
+                                 isolation_level=None)
+        client.row_factory = SQLite.dict_factory
+        client.execute("PRAGMA query_only = ON")
+        client.execute("PRAGMA mmap_size = {:d}".format(self.mmap_size))
+        client.execute("PRAGMA cache_size = {:d}".format(self.cache_size))
+        client.execute("PRAGMA busy_timeout = {:d}".format(self.busy_timeout))
+        if replaced:
+            self._check_indexes(client)
+        with self._lock:
+            self._connections[threading.get_ident()] = (threading.current_thread(), client)
+        self._local.client = client
+        self._local.identity = identity
+        self._local.generation = generation
+        return client
+
+    def _release(self):
+        """Close the connection of the calling thread, other threads re-open their own when they notice."""
+        client = getattr(self._local, 'client', None)
+        if client is not None:
+            self._local.client = None
+            with self._lock:
+                self._connections.pop(threading.get_ident(), None)
+            client.close()
+
+    def _close_dead(self):
+        """Close the connections of finished threads."""
+        for ident, (thread, client) in list(self._connections.items()):
+            if not thread.is_alive():
+                client.close()
+                del self._connections[ident]
+
+    def _check_indexes(self, client):
+        """Warn about the queried columns without an index, the query path never writes to autorun.db."""
+        try:
+            # plain tuples, dict_factory expects autorun rows
+            cursor = client.cursor()
+            cursor.row_factory = None
+            columns = set(row[1] for row in cursor.execute("PRAGMA table_info(autorun)"))
+            indexed = set()
+            for index in cursor.execute("PRAGMA index_list(autorun)").fetchall():
+                leading = cursor.execute("PRAGMA index_xinfo('{}')".format(index[1].replace("'", "''"))).fetchone()
+                if leading is not None and leading[2]:
+                    indexed.add((leading[2], leading[4].upper()))
+        except sqlite3.Error as e:
+            _logger.warning("Check autorun.db indexes failed: {}".format(e))
+            return
+        missing = [column for column in QUERY_COLUMNS if column in columns and
+                   (column, "NOCASE" if column in NOCASE_COLUMNS else "BINARY") not in indexed]
+        if missing:
+            _logger.warning("autorun.db has no index on {}, lookups scan the whole table, create them with "
+                            "'python -m ocr.sigma.database.autorun {}'".format(", ".join(missing), self.db_name))
+
+    @staticmethod
+    def create_indexes(db_name):
+        """Create the indexes of the queried columns if missing, autorun.db itself only creates the table."""
+        with contextlib.closing(sqlite3.connect(db_name, timeout=DEFAULT_BUSY_TIMEOUT / 1000.0)) as client:
+            columns = set(row[1] for row in client.execute("PRAGMA table_info(autorun)"))
+            for column in QUERY_COLUMNS:
+                if column in columns:
+                    collate = " COLLATE NOCASE" if column in NOCASE_COLUMNS else ""
+                    client.execute("CREATE INDEX IF NOT EXISTS autorun_{0} ON autorun({0}{1})".format(column, collate))
+            client.commit()
 
     def close(self):
-        if self._client:
-            self._client.close()
-            self._client = self._db = None
-            _logger.debug("DB autorun closed")
+        """Close the connections of all threads."""
+        with self._lock:
+            for _, client in self._connections.values():
+                client.close()
+            if self._connections:
+                _logger.debug("DB autorun closed")
+            self._connections.clear()
+            self._identity = None
+            self._generation += 1
 
     def check(self):
-        if not self._db:
-            self.connect()
-        return self._db is not None
+        """Get the connection of the calling thread, re-opened if autorun.db was replaced, None if missing."""
+        client = getattr(self._local, 'client', None)
+        if client is None or self._local.generation != self._generation or self._stat() != self._local.identity:
+            client = self.connect()
+        return client
 
     def find(self, latest=True, **kwargs):
-        """Find the records by kwargs."""
-        if not self.check():
+        """Find the records by kwargs, only the one with the latest datetime if latest."""
+        client = self.check()
+        if client is None:
             return []
-        command = "SELECT * FROM autorun WHERE "
         queries = []
-        if "status" in kwargs and kwargs["status"] is not None:
-            queries.append("status='%s'" % kwargs.get("status"))
-        if "series_instance_uid" in kwargs and kwargs["series_instance_uid"] is not None:
-            queries.append("series_instance_uid='%s'" % kwargs.get("series_instance_uid"))
-        if "study_instance_uid" in kwargs and kwargs["study_instance_uid"] is not None:
-            queries.append("study_instance_uid='%s'" % kwargs.get("study_instance_uid"))
-        if "patient_id" in kwargs and kwargs["patient_id"] is not None:
-            queries.append("patient_id='%s' COLLATE NOCASE" % kwargs.get("patient_id"))
-        if "accession_number" in kwargs and kwargs["accession_number"] is not None:
-            queries.append("accession_number='%s'" % kwargs.get("accession_number"))
-        command += " and ".join(queries)
-        _logger.debug("Fetchall SQL: '%s'" % command)
-        result = self._db.execute(command).fetchall()
-        if latest and len(result) > 1:
-            return [sorted(result, key=lambda x: time.strptime(x['datetime'], '%a, %d %b %Y %H:%M:%S GMT'), reverse=True)[0]]
-        else:
-            return result
+        params = []
+        for column in QUERY_COLUMNS:
+            if kwargs.get(column) is not None:
+                collate = " COLLATE NOCASE" if column in NOCASE_COLUMNS else ""
+                queries.append("{}=?{}".format(column, collate))
+                params.append(kwargs[column])
+        command = "SELECT * FROM autorun WHERE " + " and ".join(queries)
+        if latest:
+            command += " ORDER BY {} DESC, rowid LIMIT 1".format(SORTABLE_DATETIME)
+        _logger.debug("Fetchall SQL: '{}' {}".format(command, params))
+        return client.execute(command, params).fetchall()
 
     @staticmethod
     def dict_factory(cursor, row):
@@ -71,3 +184,15 @@ class SQLite(AbstractDataBase):
         if 'type' in d.keys():
             d['job_type'] = d.pop('type')
         return d
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the indexes of the autorun.db columns queried by the OCR server')
+    parser.add_argument('db_name', help='path of autorun.db')
+    args = parser.parse_args()
+    SQLite.create_indexes(args.db_name)
+    print('Indexed {}'.format(args.db_name))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 import os
 import logging
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
 
 from ocr.sigma.database.abstract import AbstractDataBase
 
@@ -27,6 +28,10 @@ STATUS_TRANS = {
     "push_hanged": "hanged"
 }
 
+# fields of the datasets find() matches on, and the autorun fields a series is joined on
+DATASET_INDEXES = ("PatientID", "StudyInstanceUID", "SeriesInstanceUID", "AccessionNumber")
+AUTORUN_INDEX = [("StudyInstanceUID", ASCENDING), ("PatientID", ASCENDING)]
+
 
 class MongoDB(AbstractDataBase):
     """Connect and query mongodb."""
@@ -34,13 +39,23 @@ class MongoDB(AbstractDataBase):
     def connect(self):
         self._client = MongoClient(self.host_name)
         self._db = self._client[self.db_name]
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the indexes find() relies on if missing, sigmadicom owns the collections."""
+        try:
+            for field in DATASET_INDEXES:
+                self._db.datasets.create_index(field, background=True)
+            self._db.autorun.create_index(AUTORUN_INDEX, background=True)
+        except PyMongoError as e:
+            _logger.warning("Index sigmadicom failed, lookups scan the collections: {}".format(e))
 
     def close(self):
         self._client.close()
         _logger.debug("DB sigmadicom closed")
 
     def find(self, latest=True, **kwargs):
-        """Find the records by kwargs."""
+        """Find the records by kwargs, newest series first, only the latest one if latest."""
         queries = {}
         # if "status" in kwargs and kwargs["status"] is not None:
         #     queries["status"] = kwargs.get("status")
@@ -53,19 +68,29 @@ class MongoDB(AbstractDataBase):
         if "accession_number" in kwargs and kwargs["accession_number"] is not None:
             queries["AccessionNumber"] = kwargs.get("accession_number")
 
-        matched_serieses = self._db.datasets.find(queries).sort([('_id', -1)])
-        autorun_records = []
-        for series in matched_serieses:
-            record = self._db.autorun.find_one({"StudyInstanceUID": series.get('StudyInstanceUID'), "PatientID": series.get('PatientID')})
-            if not record:
-                continue
-            autorun_records.append((series, record))
-        if autorun_records and latest:
-            autorun_records = [autorun_records[0]]
+        # one round trip: the autorun records of the study of every matched series are joined on the server,
+        # the first one of the same patient is kept and series without one are dropped
+        pipeline = [
+            {"$match": queries},
+            {"$sort": {"_id": -1}},
+            {"$lookup": {"from": "autorun", "localField": "StudyInstanceUID", "foreignField": "StudyInstanceUID",
+                         "as": "autorun"}},
+            {"$project": {
+                "_id": 0, "PatientID": 1, "StudyInstanceUID": 1, "SeriesInstanceUID": 1,
+                "autorun": {"$arrayElemAt": [{"$filter": {"input": "$autorun", "as": "run",
+                                                          "cond": {"$eq": ["$$run.PatientID", "$PatientID"]}}}, 0]},
+            }},
+            {"$match": {"autorun": {"$exists": True}}},
+            {"$project": {"PatientID": 1, "StudyInstanceUID": 1, "SeriesInstanceUID": 1,
+                          "autorun.job_type": 1, "autorun.job_id": 1, "autorun.status": 1}},
+        ]
+        if latest:
+            pipeline.append({"$limit": 1})
 
         job_types = []
         results = []
-        for dataset, autorun in autorun_records:
+        for dataset in self._db.datasets.aggregate(pipeline):
+            autorun = dataset['autorun']
             job_type = JOB_TYPE_TRANS.get(autorun['job_type'], autorun['job_type'])
             if job_type in job_types:   # only return latest same job type
                 continue
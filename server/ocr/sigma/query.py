@@ -1,11 +1,18 @@
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
+from ocr.cache import LRUCache
 from ocr.sigma.config import Configuration
-from ocr.sigma.statistics import get_detect_count
+from ocr.sigma.request.asyncclient import CLIENT_ASYNC, CLIENT_SYNC, AsyncRequest
+from ocr.sigma.statistics import get_count_field, get_detect_ids, get_unique_id
 
 _logger = logging.getLogger(__name__)
 
+# a job in these states has its result json written, it does not change any more
+FINISHED_STATUS = ('computed', 'pushing', 'succeed', 'hanged')
+HTTP_OPTIONS = ('pool_size', 'connect_timeout', 'read_timeout', 'retries', 'backoff')
+
 
 class Query(object):
     """Get data from PACS and process them."""
@@ -20,9 +27,11 @@ class Query(object):
             from ocr.sigma.database.autorun import SQLite
             from ocr.sigma.request.sigmaserver import ServerRequest
             sqlite = conf.fetch('database', 'sqlite')
-            self._database = SQLite(sqlite['db_name'])
+            pragmas = {k: sqlite[k] for k in ('mmap_size', 'cache_size', 'busy_timeout') if k in sqlite}
+            self._database = SQLite(sqlite['db_name'], **pragmas)
             server = self._context['server']
-            self._request = ServerRequest(server['endpoint'], access_key=server['key'], secret_key=server['secret'])
+            http = {k: server[k] for k in HTTP_OPTIONS if k in server}
+            self._request = ServerRequest(server['endpoint'], access_key=server['key'], secret_key=server['secret'], **http)
             _logger.info('AutoRun mode')
         elif category == 'mongodb':
             from ocr.sigma.database.sigmadicom import MongoDB
@@ -30,8 +39,15 @@ class Query(object):
             mongodb = conf.fetch('database', 'mongodb')
             self._database = MongoDB(mongodb['db_name'], mongodb['hostnames'])
             server = self._context['server']
-            self._request = CloudRequest(server['endpoint'], access_key=server['key'], secret_key=server['secret'], account=server['account'])
+            http = {k: server[k] for k in HTTP_OPTIONS if k in server}
+            self._request = CloudRequest(server['endpoint'], access_key=server['key'], secret_key=server['secret'], account=server['account'], **http)
             _logger.info('SigmaDicom mode')
+        if self._context['server'].get('client', CLIENT_SYNC) == CLIENT_ASYNC:
+            self._request = AsyncRequest(self._request)
+        size = conf.get_query_cache().get('size', 0)
+        self._counts = LRUCache(size) if size > 0 else None
+        workers = conf.get_query_workers()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query') if workers > 1 else None
 
     def get_series(self, latest, **kwargs):
         """Get series accord by kwargs conditions."""
@@ -42,23 +58,60 @@ class Query(object):
             raise ValueError("The input parameter was missing")
         # Only query succeed
         results = self._database.find(latest, **kwargs)
-        for result in results:
-            if result['status'] in ['computed', 'pushing', 'succeed', 'hanged']:
-                try:
-                    result['lesion_count'] = get_detect_count(result, self.get_json)
-                except Exception as e:
-                    _logger.warning(e)
-            elif result['status'] == 'waiting':
-                try:
-                    job_data = self._request.get_job(result['job_id'])
-                except Exception as e:
-                    _logger.warning(e)
-                else:
-                    result['order_number'] = job_data.get('queue', {}).get('location')
-                    if result['order_number'] is not None:
-                        result['wait_time'] = result['order_number'] * 2        # x2 cost time
+        missing = self._get_cached_counts([result for result in results if result['status'] in FINISHED_STATUS])
+        waiting = [result for result in results if result['status'] == 'waiting']
+        # the lesion counts of the finished records and the queue of the waiting ones, all at once
+        counted = list({(_id, field) for _, _, field, ids in missing for _id in ids})
+        calls = [('get_count', _id, field) for _id, field in counted]
+        calls += [('get_job', result['job_id']) for result in waiting]
+        answers = self._request.gather(calls, self._executor) if calls else []
+        self._set_lesion_counts(missing, dict(zip(counted, answers)))
+        for result, job_data in zip(waiting, answers[len(counted):]):
+            if isinstance(job_data, Exception):
+                _logger.warning(job_data)
+            else:
+                result['order_number'] = job_data.get('queue', {}).get('location')
+                if result['order_number'] is not None:
+                    result['wait_time'] = result['order_number'] * 2        # x2 cost time
         return results
 
+    def _get_cached_counts(self, results):
+        """Set the cached lesion count of finished results.
+
+        Returns [(result, cache key, count field, detect ids)] of the others, a record these fail on is skipped.
+        """
+        missing = []
+        for result in results:
+            try:
+                key = (result.get('job_type'), get_unique_id(result), result.get('job_id'), result['status'])
+                field = get_count_field(result)
+                ids = get_detect_ids(result)
+            except Exception as e:
+                _logger.warning(e)
+                continue
+            count = self._counts.get(key) if self._counts is not None else None
+            if count is None:
+                missing.append((result, key, field, ids))
+            else:
+                result['lesion_count'] = count
+        return missing
+
+    def _set_lesion_counts(self, missing, counts):
+        """Set the lesion count of the missing results from the counts of their result jsons, caching it."""
+        for result, key, field, ids in missing:
+            try:
+                parts = [counts[(_id, field)] for _id in ids]
+                for part in parts:
+                    if isinstance(part, Exception):
+                        raise part
+                count = max(parts)
+            except Exception as e:
+                _logger.warning(e)
+                continue
+            result['lesion_count'] = count
+            if self._counts is not None:
+                self._counts.put(key, count)
+
     def get_json(self, unique_id):
         return self._request.get_json(unique_id)
 
@@ -1,11 +1,15 @@
-import base64
-import hashlib
-import hmac
+import threading
 import time
 from abc import ABC, abstractmethod
 
 import requests
 
+from ocr import metrics
+from ocr.sigma.request.session import (DEFAULT_BACKOFF, DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE,
+                                       DEFAULT_READ_TIMEOUT, DEFAULT_RETRIES, create_session)
+from ocr.sigma.request.signer import ResourceTemplates, Signer
+from ocr.sigma.request.stream import CHUNK_SIZE, DRAIN_SIZE
+
 try:
     from urlparse import urlsplit
 except ImportError:
@@ -17,12 +21,100 @@ class AbstractRequest(ABC):
 
     AUTH_PREFIX = "12Sigma"
     AUTH_HEADERS_PREFIX = "x-sigma-"
+    BACKEND = "sigma"
 
     def __init__(self, endpoint, **kwargs):
-        """Set initial parameters."""
+        """Set initial parameters.
+
+        The optional pool_size, connect_timeout, read_timeout, retries and backoff tune the keep-alive session.
+        """
         self.endpoint = endpoint if endpoint.startswith("http://") else "http://" + endpoint
         self.access_key = kwargs["access_key"]
         self.secret_key = kwargs["secret_key"]
+        self._signer = Signer(self.secret_key)
+        self._resources = ResourceTemplates(self._get_canonicalized_resource)
+        self.pool_size = kwargs.get("pool_size", DEFAULT_POOL_SIZE)
+        self.timeout = (kwargs.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+                        kwargs.get("read_timeout", DEFAULT_READ_TIMEOUT))
+        self.retries = kwargs.get("retries", DEFAULT_RETRIES)
+        self.backoff = kwargs.get("backoff", DEFAULT_BACKOFF)
+        self.session, self._adapter = create_session(self.pool_size, self.retries, self.backoff, self._connected)
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def _connected(self):
+        metrics.inc(metrics.UPSTREAM_CONNECTIONS, backend=self.BACKEND)
+
+    def _request(self, method, url, **kwargs):
+        """Send a call on the session with the configured timeouts, counting it."""
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self._requests += 1
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.inc(metrics.UPSTREAM_REQUESTS, backend=self.BACKEND, method=method, status="error")
+            raise
+        metrics.inc(metrics.UPSTREAM_REQUESTS, backend=self.BACKEND, method=method, status=response.status_code)
+        return response
+
+    def connection_stats(self):
+        """Get the calls sent, the connections opened for them and how many calls reused an open connection."""
+        with self._lock:
+            calls = self._requests
+        connections = self._adapter.connections
+        return {"requests": calls, "connections": connections, "reused": max(0, calls - connections)}
+
+    def close(self):
+        self.session.close()
+
+    def _run(self, operation):
+        """Run an operation on the session.
+
+        An operation is a generator yielding each call as (method, url, headers, data), receiving its answer
+        as (status code, text) and returning the result, so that asynchronous clients can run it too.
+        A call may add a CountScanner as fifth item: a successful answer is then streamed into it and
+        received as (status code, count), the download cut short once the count is read.
+        """
+        try:
+            call = next(operation)
+            while True:
+                call = operation.send(self._send(*call))
+        except StopIteration as stop:
+            return stop.value
+
+    def _send(self, method, url, headers, data, scanner=None):
+        """Send a call of an operation, returns its answer."""
+        if scanner is None:
+            response = self._request(method, url, headers=headers, data=data)
+            return response.status_code, response.text
+        with self._request(method, url, headers=headers, data=data, stream=True) as response:
+            if response.status_code // 100 != 2:
+                return response.status_code, response.text
+            drained = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not scanner.done:
+                    scanner.feed(chunk)
+                    continue
+                drained += len(chunk)
+                if drained >= DRAIN_SIZE:
+                    break
+            return response.status_code, scanner.finish()
+
+    def gather(self, calls, executor=None):
+        """Run calls [(method name, *args)] on the executor if given, in sequence otherwise.
+
+        Returns the results in the order of the calls, an exception raised by a call in its place.
+        """
+        def run(call):
+            try:
+                return getattr(self, call[0])(*call[1:])
+            except Exception as e:
+                return e
+
+        if executor is None or len(calls) <= 1:
+            return list(map(run, calls))
+        return list(executor.map(run, calls))
 
     def _get_gmt_time(self):
         """Get formatted time (GMT time)."""
@@ -66,8 +158,8 @@ class AbstractRequest(ABC):
         canonicalized = (parsed.netloc + parsed.path + "?" + query)
         return canonicalized
 
-    def _gen_sign(self, secret, verb, headers, url):
-        """Generate signature for http request."""
+    def _get_string_to_sign(self, verb, headers, canonicalized_resource):
+        """Get the string signed for http request."""
         if headers is None:
             headers = dict()
         # Format http, convert prefix is x-sigma- to lower
@@ -87,8 +179,6 @@ class AbstractRequest(ABC):
             content_md5 = content_md5.decode("utf-8")
         # Get canonicalized headers
         canonicalized_headers = self._get_canonicalized_headers(headers)
-        # Get canonicalized resource
-        canonicalized_resource = self._get_canonicalized_resource(url)
         canonicalized = ""
         if canonicalized_headers:
             canonicalized += (canonicalized_headers + "\n" + canonicalized_resource)
@@ -100,25 +190,54 @@ class AbstractRequest(ABC):
                           content_type,
                           date,
                           canonicalized])
-        digest = hmac.new(secret.encode(), sign.encode(), hashlib.sha256).digest()
-        signature = base64.b64encode(digest).strip()
-        if isinstance(signature, bytes):
-            signature = signature.decode("utf-8")
-        return signature
+        return sign
+
+    def _gen_sign(self, secret, verb, headers, url):
+        """Generate signature for http request."""
+        signer = self._signer if secret == self.secret_key else Signer(secret)
+        return signer.sign(self._get_string_to_sign(verb, headers, self._get_canonicalized_resource(url)))
+
+    def _sign_url(self, verb, headers, template, *args):
+        """Format the url of a call from a template and set its Authorization header.
+
+        The resource is canonicalized once per template, see ResourceTemplates.
+        """
+        url, resource = self._resources.get(template, self.endpoint, *args)
+        signature = self._signer.sign(self._get_string_to_sign(verb, headers, resource))
+        headers["Authorization"] = self.AUTH_PREFIX + " " + self.access_key + ":" + signature
+        return url
 
     def _get_auth(self, key, secret, verb, headers, url):
         """Get Authorization for http request."""
         return self.AUTH_PREFIX + " " + key + ":" + self._gen_sign(secret, verb, headers, url)
 
     @abstractmethod
-    def get_job(self, unique_id):
-        """Get the job status."""
+    def _get_job(self, unique_id):
+        """Operation getting the job status."""
         pass
 
     @abstractmethod
-    def get_json(self, unique_id):
+    def _get_json(self, unique_id):
         pass
 
     @abstractmethod
-    def raise_priority(self, unique_id):
+    def _get_count(self, unique_id, field):
+        """Operation reading `field.count` of the result json, streamed with a CountScanner."""
         pass
+
+    def _raise_priority(self, unique_id):
+        raise NotImplementedError
+
+    def get_job(self, unique_id):
+        """Get the job status."""
+        return self._run(self._get_job(unique_id))
+
+    def get_json(self, unique_id):
+        return self._run(self._get_json(unique_id))
+
+    def get_count(self, unique_id, field):
+        """Get `field.count` of the result json without loading it, 0 if missing."""
+        return self._run(self._get_count(unique_id, field))
+
+    def raise_priority(self, unique_id):
+        return self._run(self._raise_priority(unique_id))
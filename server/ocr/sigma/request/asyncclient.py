@@ -0,0 +1,152 @@
+# -*- coding=utf-8 -*-
+"""Run the calls of a request backend on aiohttp, so that the calls of one query go out concurrently.
+
+AsyncRequest has the get_job, get_json, get_count and raise_priority of the backend it wraps and runs their
+operations on an event loop thread of its own. gather() sends many of them at once over at most pool_size connections.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import threading
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+from ocr import metrics
+from ocr.sigma.request.session import RETRY_METHODS, RETRY_STATUS
+from ocr.sigma.request.stream import CHUNK_SIZE, DRAIN_SIZE, CountScanner
+
+_logger = logging.getLogger(__name__)
+
+CLIENT_SYNC = 'sync'
+CLIENT_ASYNC = 'async'
+
+
+class AsyncRequest(object):
+    """Asynchronous client with the interface of AbstractRequest, wrapping a ServerRequest or CloudRequest."""
+
+    def __init__(self, backend):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required by the "{}" request client'.format(CLIENT_ASYNC))
+        self.backend = backend
+        self._requests = 0
+        self._connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='sigma-request', daemon=True)
+        self._thread.start()
+        self._session = self._submit(self._create_session())
+        _logger.info('Asynchronous {} client, {} connections'.format(backend.BACKEND, backend.pool_size))
+
+    async def _create_session(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._connected)
+        connect_timeout, read_timeout = self.backend.timeout
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.backend.pool_size, limit_per_host=self.backend.pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            trace_configs=[trace])
+
+    async def _connected(self, session, context, params):
+        self._connections += 1
+        metrics.inc(metrics.UPSTREAM_CONNECTIONS, backend=self.backend.BACKEND)
+
+    def _submit(self, coroutine):
+        """Run a coroutine on the loop thread and wait for its result, never call it from the loop thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _send(self, method, url, headers, data, scanner=None):
+        """Send a call like AbstractRequest._send, returns (status code, text or count)."""
+        headers = dict(headers or {})
+        if isinstance(data, dict):
+            data = urlencode(data)
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+        self._requests += 1
+        retries = self.backend.retries if method in RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            try:
+                async with self._session.request(method, yarl.URL(url, encoded=True), headers=headers,
+                                                 data=data) as response:
+                    status_code = response.status
+                    if scanner is None or status_code // 100 != 2:
+                        content = await response.text()
+                    else:
+                        # a scanner fed by a failed attempt is not reused
+                        content = await self._scan(response, CountScanner(scanner.field))
+                if status_code not in RETRY_STATUS or attempt >= retries:
+                    break
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    metrics.inc(metrics.UPSTREAM_REQUESTS, backend=self.backend.BACKEND, method=method, status='error')
+                    raise
+            await asyncio.sleep(self.backend.backoff * 2 ** attempt)
+            attempt += 1
+        metrics.inc(metrics.UPSTREAM_REQUESTS, backend=self.backend.BACKEND, method=method, status=status_code)
+        return status_code, content
+
+    @staticmethod
+    async def _scan(response, scanner):
+        """Stream the body into the scanner up to the count, the rest is dropped with the connection if large."""
+        drained = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            if not scanner.done:
+                scanner.feed(chunk)
+                continue
+            drained += len(chunk)
+            if drained >= DRAIN_SIZE:
+                break
+        return scanner.finish()
+
+    async def _run(self, name, *args):
+        """Run the operation `name` of the backend, like AbstractRequest._run."""
+        operation = getattr(self.backend, '_' + name)(*args)
+        try:
+            call = next(operation)
+            while True:
+                call = operation.send(await self._send(*call))
+        except StopIteration as stop:
+            return stop.value
+
+    def get_job(self, unique_id):
+        return self._submit(self._run('get_job', unique_id))
+
+    def get_json(self, unique_id):
+        return self._submit(self._run('get_json', unique_id))
+
+    def get_count(self, unique_id, field):
+        return self._submit(self._run('get_count', unique_id, field))
+
+    def raise_priority(self, unique_id):
+        return self._submit(self._run('raise_priority', unique_id))
+
+    def gather(self, calls, executor=None):
+        """Run calls [(method name, *args)] concurrently, executor is unused.
+
+        Returns the results in the order of the calls, an exception raised by a call in its place.
+        """
+        async def run_all():
+            return await asyncio.gather(*(self._run(*call) for call in calls),
+                                        return_exceptions=True)
+
+        return self._submit(run_all())
+
+    def connection_stats(self):
+        """Get the calls sent, the connections opened for them and how many calls reused an open connection."""
+        calls, connections = self._requests, self._connections
+        return {"requests": calls, "connections": connections, "reused": max(0, calls - connections)}
+
+    def close(self):
+        self._submit(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self.backend.close()
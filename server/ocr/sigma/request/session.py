@@ -0,0 +1,71 @@
+# -*- coding=utf-8 -*-
+"""Keep-alive HTTP sessions shared by the calls of one request backend."""
+from __future__ import absolute_import
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3
+
+# only idempotent calls are sent again, after a connection error, a read timeout or one of these answers
+RETRY_METHODS = frozenset(['GET', 'HEAD'])
+RETRY_STATUS = (502, 503, 504)
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter counting the connections it opens, requests minus connections are keep-alive reuses."""
+
+    def __init__(self, on_connect=None, **kwargs):
+        self.connections = 0
+        self._on_connect = on_connect
+        self._lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        manager = self.poolmanager
+        manager.pool_classes_by_scheme = {scheme: self._counting(cls)
+                                          for scheme, cls in manager.pool_classes_by_scheme.items()}
+
+    def _connected(self):
+        with self._lock:
+            self.connections += 1
+        if self._on_connect is not None:
+            self._on_connect()
+
+    def _counting(self, pool_class):
+        adapter = self
+
+        class CountingPool(pool_class):
+            def _new_conn(self):
+                adapter._connected()
+                return super()._new_conn()
+
+        return CountingPool
+
+
+def create_retry(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Retry idempotent calls `retries` times, waiting backoff * 2 ** n seconds in between."""
+    kwargs = dict(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **kwargs)
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, on_connect=None):
+    """Get a session keeping up to pool_size connections alive per host, and its adapter."""
+    adapter = CountingAdapter(on_connect=on_connect, pool_maxsize=pool_size, max_retries=create_retry(retries, backoff))
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session, adapter
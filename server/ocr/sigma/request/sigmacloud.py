@@ -1,6 +1,3 @@
-import base64
-import hashlib
-import hmac
 import json
 import logging
 import time
@@ -8,6 +5,8 @@ import time
 import requests
 
 from ocr.sigma.request.abstract import AbstractRequest
+from ocr.sigma.request.signer import Signer
+from ocr.sigma.request.stream import CountScanner
 
 _logger = logging.getLogger(__name__)
 
@@ -57,60 +56,49 @@ def canonicalize_resource(resource):
     return res + '?' + param
 
 
+def get_string_to_sign(method, headers, canonicalized_resource):
+    """Get the string signed for a call, headers holding its Date."""
+    content_type = headers.get('Content-Type', '')
+    content_md5 = headers.get('Content-MD5', '')
+    canonicalized_gd_headers = ""
+    tmp_headers = format_header(headers)
+    if len(tmp_headers) > 0:
+        x_header_list = tmp_headers.keys()
+        # x_header_list.sort()
+        for k in x_header_list:
+            if k.startswith(SELF_DEFINE_HEADER_PREFIX):
+                canonicalized_gd_headers += "%s:%s\n" % (k, tmp_headers[k])
+    return method + "\n" + content_md5 + "\n" + content_type + "\n" + headers["Date"] + "\n" + canonicalized_gd_headers + canonicalized_resource
+
+
 class SigmaAuth(requests.auth.AuthBase):
     def __init__(self, access_key_id, access_key_secret, verbose=True):
         self.access_key_id = access_key_id
-        self.access_key_secret = access_key_secret
+        self.signer = Signer(access_key_secret)
         self.verbose = verbose
         if verbose:
-            _logger.debug("Initialize SigmaAuth, access key id: " + access_key_id +
-                          ", access key secret: " + access_key_secret)
+            _logger.debug("Initialize SigmaAuth, access key id: " + access_key_id)
 
     def __call__(self, r):
-        method = r.method
-        content_type = r.headers.get('Content-Type', '')
-        content_md5 = r.headers.get('Content-MD5', '')
-        canonicalized_gd_headers = ""
-        date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
-
-        resource = extract_resource_from_url(r.url)
-
-        tmp_headers = format_header(r.headers)
-        if len(tmp_headers) > 0:
-            x_header_list = tmp_headers.keys()
-            # x_header_list.sort()
-            for k in x_header_list:
-                if k.startswith(SELF_DEFINE_HEADER_PREFIX):
-                    canonicalized_gd_headers += "%s:%s\n" % (k, tmp_headers[k])
-
-        canonicalized_resource = canonicalize_resource(resource)
-        if self.verbose:
-            _logger.debug("Canonicalized resource: " + canonicalized_resource)
-
-        string_to_sign = method + "\n" + content_md5 + "\n" + content_type + "\n" + date + "\n" + canonicalized_gd_headers + canonicalized_resource
-        if self.verbose:
-            _logger.debug("String to Sign: " + string_to_sign)
-
-        try:
-            h = hmac.new(self.access_key_secret.encode(), string_to_sign.encode(), hashlib.sha256)
-            signature = base64.b64encode(h.digest()).strip()
-            if isinstance(signature, bytes):
-                signature = signature.decode("utf-8")
-
-            r.headers["Date"] = date
-            r.headers["Authorization"] = SELF_DEFINE_AUTH_PREFIX + " " + self.access_key_id + ":" + signature
-            if self.verbose:
-                _logger.info("Authorization header: " + r.headers["Authorization"])
-        except Exception as e:
-            _logger.warning(e)
-
+        self.sign(r.method, r.url, r.headers)
         return r
 
+    def sign(self, method, url, headers):
+        """Set the Date and Authorization headers of a call whose body is already encoded."""
+        headers["Date"] = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+        canonicalized_resource = canonicalize_resource(extract_resource_from_url(url))
+        string_to_sign = get_string_to_sign(method, headers, canonicalized_resource)
+        headers["Authorization"] = SELF_DEFINE_AUTH_PREFIX + " " + self.access_key_id + ":" + self.signer.sign(string_to_sign)
+        if self.verbose and _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("String to Sign: " + string_to_sign)
+        return headers
 
 
 class CloudRequest(AbstractRequest):
     """Request to SigmaCloud."""
 
+    BACKEND = "cloud"
+
     JOB_STATUS_TRANS = {
         "waiting": "waiting",
         "running": "running",
@@ -123,38 +111,54 @@ class CloudRequest(AbstractRequest):
         super().__init__(endpoint, **kwargs)
         self.account = kwargs["account"]
 
-    def get_job(self, unique_id):
-        headers = {'Content': 'application/json'}
-        url = '{}/accounts/{}/jobs/{}/?queue_info=true'.format(self.endpoint, self.account, unique_id)
+    def _get_canonicalized_resource(self, url):
+        return canonicalize_resource(extract_resource_from_url(url))
+
+    def _get_string_to_sign(self, verb, headers, canonicalized_resource):
+        return get_string_to_sign(verb, headers, canonicalized_resource)
+
+    def _get_job(self, unique_id):
+        headers = {'Content': 'application/json', 'Date': self._get_gmt_time()}
+        url = self._sign_url("GET", headers, '{}/accounts/{}/jobs/{}/?queue_info=true', self.account, unique_id)
 
-        response = requests.get(url, headers=headers, auth=SigmaAuth(self.access_key, self.secret_key))
-        if response.status_code // 100 == 2:
-            return json.loads(response.text)['data']
+        status_code, text = yield "GET", url, headers, None
+        if status_code // 100 == 2:
+            return json.loads(text)['data']
         else:
-            raise ValueError(response.text)
-
-    def get_json(self, unique_id):
-        headers = {'Content': 'application/json'}
-        url = '{}/accounts/{}/store/downloads/?filename={}.json'.format(self.endpoint, self.account, unique_id)
-
-        resp1 = requests.get(url, headers=headers, auth=SigmaAuth(self.access_key, self.secret_key))
-        if resp1.status_code // 100 == 2:
-            url = '{}&download_id={}'.format(url1, json.loads(resp1.text)['download_id'])
-            resp2 = requests.get(url, headers=headers, auth=SigmaAuth(self.access_key, self.secret_key))
-            if resp2.status_code // 100 == 2:
-                return json.loads(resp2.text)
+            raise ValueError(text)
+
+    def _get_json(self, unique_id):
+        return json.loads((yield from self._download(unique_id)))
+
+    def _get_count(self, unique_id, field):
+        return (yield from self._download(unique_id, CountScanner(field)))
+
+    def _download(self, unique_id, scanner=None):
+        """Operation downloading the result json, its text or the count read by the scanner."""
+        headers = {'Content': 'application/json', 'Date': self._get_gmt_time()}
+        url = self._sign_url("GET", headers, '{}/accounts/{}/store/downloads/?filename={}.json', self.account, unique_id)
+
+        status_code, text = yield "GET", url, headers, None
+        if status_code // 100 == 2:
+            headers = {'Content': 'application/json', 'Date': self._get_gmt_time()}
+            url = self._sign_url("GET", headers, '{}/accounts/{}/store/downloads/?filename={}.json&download_id={}',
+                                 self.account, unique_id, json.loads(text)['download_id'])
+            status_code, content = yield "GET", url, headers, None, scanner
+            if status_code // 100 == 2:
+                return content
             else:
-                raise ValueError(resp2.text)
+                raise ValueError(content)
         else:
-            raise ValueError(resp1.text)
+            raise ValueError(text)
 
-    def raise_priority(self, unique_id):
-        headers = {'Content': 'application/json'}
-        url = '{}/accounts/{}/jobs/{}/'.format(self.endpoint, self.account, unique_id)
+    def _raise_priority(self, unique_id):
+        headers = {'Content': 'application/json', 'Content-Type': 'application/x-www-form-urlencoded',
+                   'Date': self._get_gmt_time()}
+        url = self._sign_url("PATCH", headers, '{}/accounts/{}/jobs/{}/', self.account, unique_id)
 
-        response = requests.patch(url, data={"priority": 3}, headers=headers, auth=SigmaAuth(self.access_key, self.secret_key))
-        if response.status_code // 100 == 2:
-            priority_data = json.loads(response.text)
-            return self.get_job(priority_data['data']['job_id'])
+        status_code, text = yield "PATCH", url, headers, {"priority": 3}
+        if status_code // 100 == 2:
+            priority_data = json.loads(text)
+            return (yield from self._get_job(priority_data['data']['job_id']))
         else:
-            raise ValueError(response.text)
+            raise ValueError(text)
@@ -1,13 +1,14 @@
 import json
 
-import requests
-
 from ocr.sigma.request.abstract import AbstractRequest
+from ocr.sigma.request.stream import CountScanner
 
 
 class ServerRequest(AbstractRequest):
     """Request to SigmaServer."""
 
+    BACKEND = "server"
+
     JOB_STATUS_TRANS = {
         "waiting": "waiting",
         "running": "running",
@@ -19,37 +20,37 @@ class ServerRequest(AbstractRequest):
         """Set initial parameters."""
         super().__init__(endpoint, **kwargs)
 
-    def get_job(self, unique_id):
+    def _get_job(self, unique_id):
         headers = dict()
         headers["Content-Type"] = "application/json"
         headers["Date"] = self._get_gmt_time()
 
-        url = '{}/jobs?unique_id={}'.format(self.endpoint, unique_id)
-        auth = self._get_auth(self.access_key, self.secret_key, "GET", headers, url)
-        headers["Authorization"] = auth
+        url = self._sign_url("GET", headers, '{}/jobs?unique_id={}', unique_id)
 
-        response = requests.get(url, headers=headers)
-        if response.status_code // 100 == 2:
-            data = json.loads(response.text)
+        status_code, text = yield "GET", url, headers, None
+        if status_code // 100 == 2:
+            data = json.loads(text)
             for job in data:
                 return self.JOB_STATUS_TRANS.get(job.get("status"))
         else:
-            raise ValueError(response.text)
+            raise ValueError(text)
+
+    def _get_json(self, unique_id):
+        return json.loads((yield from self._download(unique_id)))
 
-    def get_json(self, unique_id):
+    def _get_count(self, unique_id, field):
+        return (yield from self._download(unique_id, CountScanner(field)))
+
+    def _download(self, unique_id, scanner=None):
+        """Operation downloading the result json, its text or the count read by the scanner."""
         headers = dict()
         headers["Content-Type"] = "application/json"
         headers["Date"] = self._get_gmt_time()
 
-        url = '{}/data/downloads/{}?format=json&category=original'.format(self.endpoint, unique_id)
-        auth = self._get_auth(self.access_key, self.secret_key, "GET", headers, url)
-        headers["Authorization"] = auth
+        url = self._sign_url("GET", headers, '{}/data/downloads/{}?format=json&category=original', unique_id)
 
-        response = requests.get(url, headers=headers)
-        if response.status_code // 100 == 2:
-            return json.loads(response.text)
+        status_code, content = yield "GET", url, headers, None, scanner
+        if status_code // 100 == 2:
+            return content
         else:
-            raise ValueError(response.text)
-
-    def raise_priority(self, unique_id):
-        raise NotImplementedError
+            raise ValueError(content)
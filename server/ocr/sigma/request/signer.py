@@ -0,0 +1,57 @@
+# -*- coding=utf-8 -*-
+"""Request signing helpers: an HMAC key prepared once per secret and canonicalized resources per url template."""
+from __future__ import absolute_import
+
+import base64
+import hashlib
+import hmac
+import re
+
+# a field value with one of these could move the query separators or be stripped, it is canonicalized in full
+_UNSAFE = re.compile('[&?#{}\x01\\s]')
+_MARK = '\x01{}\x01'
+_MARKED = re.compile('\x01(\\d+)\x01')
+
+
+class Signer(object):
+    """HMAC-SHA256 signatures with one secret, the key is hashed into the HMAC state only once."""
+
+    def __init__(self, secret):
+        self._mac = hmac.new(secret.encode() if isinstance(secret, str) else secret, digestmod=hashlib.sha256)
+
+    def sign(self, string_to_sign):
+        """Get the base64 signature of a string."""
+        mac = self._mac.copy()
+        mac.update(string_to_sign.encode())
+        return base64.b64encode(mac.digest()).decode('utf-8')
+
+    def __repr__(self):
+        return '<Signer>'
+
+
+class ResourceTemplates(object):
+    """Canonicalize the resource of urls built from templates, once per template.
+
+    A template is a format string whose first field is the endpoint, the other fields in the path or in query
+    values; no query key is repeated, so the sorted order of the query does not depend on the values.
+    """
+
+    def __init__(self, canonicalize):
+        self._canonicalize = canonicalize
+        self._templates = {}
+
+    def _template(self, template, endpoint, fields):
+        canonical = self._templates.get(template)
+        if canonical is None:
+            marked = self._canonicalize(template.format(endpoint, *(_MARK.format(i) for i in range(fields))))
+            canonical = _MARKED.sub(r'{\1}', marked.replace('{', '{{').replace('}', '}}'))
+            self._templates[template] = canonical
+        return canonical
+
+    def get(self, template, endpoint, *args):
+        """Get the url and its canonicalized resource."""
+        values = [str(arg) for arg in args]
+        url = template.format(endpoint, *values)
+        if _UNSAFE.search(''.join(values)):
+            return url, self._canonicalize(url)
+        return url, self._template(template, endpoint, len(values)).format(*values)
@@ -0,0 +1,181 @@
+# -*- coding=utf-8 -*-
+"""Find `<field>.count` in a JSON document fed chunk by chunk, without loading the document.
+
+The scanner stops as soon as the count is read: a download can be cut short, and the other members,
+however large, are skipped without being parsed. Only the bytes not yet consumed are kept.
+"""
+from __future__ import absolute_import
+
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+# once the count is read, a rest of the body up to this size is still read to keep the connection alive
+DRAIN_SIZE = CHUNK_SIZE
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+# the body of a string up to its closing quote, or up to the end of the data
+_STRING_BODY = re.compile(rb'(?:[^"\\]|\\.)*')
+_SCALAR = re.compile(rb'[^ \t\n\r"{}\[\],:]*')
+# inside a skipped array or object, up to the next string
+_PLAIN = re.compile(rb'[^"]*')
+_OPEN = (0x7b, 0x5b)
+_CLOSE = (0x7d, 0x5d)
+_QUOTE = 0x22
+
+
+class CountScanner(object):
+    """Read `field.count` of a JSON object fed with feed(chunk), 0 if the field or its count is missing.
+
+    As with json_object.get(field, {}).get('count', 0) the count is converted with int(), but the first of
+    repeated keys is used. A document that is not an object, or whose field is not one, raises ValueError.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.count = None
+        self.done = False
+        self._buf = b''
+        self._pos = 0
+        self._parser = self._parse()
+        next(self._parser)
+
+    def feed(self, chunk):
+        """Scan the next bytes of the document, returns True once the count is known."""
+        if not self.done and chunk:
+            try:
+                self._parser.send(chunk)
+            except StopIteration as stop:
+                self.done = True
+                self.count = stop.value
+        return self.done
+
+    def finish(self):
+        """Get the count at the end of the document, raises ValueError if it ended before the count was found."""
+        if not self.done:
+            raise ValueError('JSON document ended before {}.count'.format(self.field))
+        return self.count
+
+    def _more(self):
+        chunk = yield
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+
+    def _peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            yield from self._more()
+
+    def _error(self, expected):
+        return ValueError('Expected {} in JSON document, got {!r}'.format(expected, self._buf[self._pos:self._pos + 20]))
+
+    def _string(self):
+        """Read the string at the position."""
+        while True:
+            end = _STRING_BODY.match(self._buf, self._pos + 1).end()
+            if end < len(self._buf) and self._buf[end] == _QUOTE:
+                raw = self._buf[self._pos:end + 1]
+                self._pos = end + 1
+                return json.loads(raw.decode('utf-8'))
+            yield from self._more()
+
+    def _scalar(self):
+        """Read the number, true, false or null at the position."""
+        while True:
+            end = _SCALAR.match(self._buf, self._pos).end()
+            if end < len(self._buf):
+                raw = self._buf[self._pos:end]
+                self._pos = end
+                return json.loads(raw.decode('utf-8'))
+            yield from self._more()
+
+    def _skip_string(self):
+        self._pos += 1
+        while True:
+            end = _STRING_BODY.match(self._buf, self._pos).end()
+            if end < len(self._buf) and self._buf[end] == _QUOTE:
+                self._pos = end + 1
+                return
+            # keep a trailing backslash, it escapes the first byte of the next chunk
+            self._pos = end
+            yield from self._more()
+
+    def _skip_value(self):
+        c = yield from self._peek()
+        if c == _QUOTE:
+            yield from self._skip_string()
+            return
+        if c not in _OPEN:
+            yield from self._scalar()
+            return
+        depth = 0
+        while True:
+            if self._pos >= len(self._buf):
+                yield from self._more()
+                continue
+            if self._buf[self._pos] == _QUOTE:
+                yield from self._skip_string()
+                continue
+            end = _PLAIN.match(self._buf, self._pos).end()
+            segment = self._buf[self._pos:end]
+            net = segment.count(b'{') + segment.count(b'[') - segment.count(b'}') - segment.count(b']')
+            if depth + net > 0:
+                # a member value is followed by a comma and a key, or by the end of its object: if it had
+                # closed in this segment the depth could not rise above zero again before the next string
+                depth += net
+                self._pos = end
+                continue
+            for i in range(self._pos, end):
+                if self._buf[i] in _OPEN:
+                    depth += 1
+                elif self._buf[i] in _CLOSE:
+                    depth -= 1
+                    if depth == 0:
+                        self._pos = i + 1
+                        return
+
+    def _find(self, name):
+        """Skip the members of the object being read up to the key `name`, False at the end of the object."""
+        c = yield from self._peek()
+        if c == 0x7d:
+            self._pos += 1
+            return False
+        while True:
+            c = yield from self._peek()
+            if c != _QUOTE:
+                raise self._error('a key')
+            key = yield from self._string()
+            c = yield from self._peek()
+            if c != 0x3a:
+                raise self._error(':')
+            self._pos += 1
+            if key == name:
+                return True
+            yield from self._skip_value()
+            c = yield from self._peek()
+            self._pos += 1
+            if c == 0x7d:
+                return False
+            if c != 0x2c:
+                raise self._error(', or }')
+
+    def _object(self, name):
+        c = yield from self._peek()
+        if c != 0x7b:
+            raise self._error('{} object'.format(name))
+        self._pos += 1
+
+    def _parse(self):
+        yield from self._object('a JSON')
+        if not (yield from self._find(self.field)):
+            return 0
+        yield from self._object(self.field)
+        if not (yield from self._find('count')):
+            return 0
+        c = yield from self._peek()
+        if c in _OPEN:
+            raise self._error('{}.count number'.format(self.field))
+        value = yield from (self._string() if c == _QUOTE else self._scalar())
+        return int(value)
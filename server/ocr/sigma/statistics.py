@@ -1,34 +1,15 @@
 import json
 
-__all__ = ['get_unique_id', 'get_detect_count']
+__all__ = ['get_unique_id', 'get_detect_ids', 'get_count_field']
 
 
-def get_lung_nodule_count(json_object):
-    return int(json_object.get('Nodules', {}).get('count', 0))
-
-
-def get_lung_dr_count(json_object):
-    return int(json_object.get('Diseases', {}).get('count', 0))
-
-
-def get_mammo_count(json_object):
-    return int(json_object.get('MammoDisease', {}).get('count', 0))
-
-
-def get_brain_count(json_object):
-    return int(json_object.get('ICHDisease', {}).get('count', 0))
-
-
-def get_liver_count(json_object):
-    return int(json_object.get('lesion', {}).get('count', 0))
-
-
-HANDLERS = {
-    'lung_nodule_det': get_lung_nodule_count,
-    'lung_dr_det': get_lung_dr_count,
-    'mammo_det': get_mammo_count,
-    'brain_det': get_brain_count,
-    'liver_det': get_liver_count,
+# the top level field of the result json holding the lesion count
+COUNT_FIELDS = {
+    'lung_nodule_det': 'Nodules',
+    'lung_dr_det': 'Diseases',
+    'mammo_det': 'MammoDisease',
+    'brain_det': 'ICHDisease',
+    'liver_det': 'lesion',
 }
 
 
@@ -48,15 +29,18 @@ def get_unique_id(record):
     return record[level]
 
 
-def get_detect_count(record, get_func):
+def get_detect_ids(record):
+    """Get the ids of the result json of a record, a mammo_det unique id joins several with '-'."""
     unique_id = get_unique_id(record)
     if record.get('job_type') == 'mammo_det':
-        unique_id = unique_id.split('-')
-    else:
-        unique_id = [unique_id]
-    count = set()
-    for _id in unique_id:
-        content = get_func(_id)
-        slot = HANDLERS.get(record.get('job_type'))
-        count.add(slot(content))
-    return count and max(count) or 0
+        return unique_id.split('-')
+    return [unique_id]
+
+
+def get_count_field(record):
+    """Get the field of the result json holding the lesion count of a record, see CountScanner."""
+    field = COUNT_FIELDS.get(record.get('job_type'))
+    if not field:
+        raise ValueError('Unsupported detect type')
+    return field
+
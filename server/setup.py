@@ -42,6 +42,7 @@ def build_docker(version):
     shutil.copytree('conf', 'deploy/docker/sigma-ocr/conf', ignore=shutil.ignore_patterns('*.exe', '*.xml'))
     shutil.copytree('ocr', 'deploy/docker/sigma-ocr/ocr', ignore=shutil.ignore_patterns('__pycache__', '*.pyc'))
     shutil.copyfile('autoserv.py', 'deploy/docker/sigma-ocr/autoserv.py')
+    shutil.copyfile('gunicorn.conf.py', 'deploy/docker/sigma-ocr/gunicorn.conf.py')
     shutil.copyfile('requirements.txt', 'deploy/docker/sigma-ocr/requirements.txt')
     if OS != 'Linux':
         name = 'BuoyServer-{}'.format(version)